@@ -0,0 +1,560 @@
+"""Performance benchmarks for the Diffusion Lite API.
+
+Run from the api/ directory:
+
+    python benchmark.py imports
+    python benchmark.py planner --model v1-5-pruned-emaonly.safetensors
+    python benchmark.py precision --model v1-5-pruned-emaonly.safetensors
+    python benchmark.py quantize --model v1-5-pruned-emaonly.safetensors --min-psnr 20
+    python benchmark.py engines --model v1-5-pruned-emaonly.safetensors
+    python benchmark.py workers --model v1-5-pruned-emaonly.safetensors --max-workers 3
+    python benchmark.py schedulers --model v1-5-pruned-emaonly.safetensors --steps 10,20,30
+    python benchmark.py upload --photo 4032x3024
+    python benchmark.py outputs --image ../web/public/outputs/example.png
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+HEAVY_MODULES = ["torch", "diffusers", "transformers", "safetensors"]
+
+
+def run_python(code, env=None):
+    """Run a snippet in a fresh interpreter (cold imports) and return its JSON output"""
+    started = time.time()
+    proc = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=API_DIR,
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, **(env or {})),
+    )
+    wall = time.time() - started
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "benchmark snippet failed")
+    return json.loads(proc.stdout.strip().splitlines()[-1]), wall
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(x)) for x in [h] + [r[i] for r in rows]) for i, h in enumerate(headers)]
+    print("  ".join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    print("  ".join("-" * w for w in widths))
+    for row in rows:
+        print("  ".join(str(x).ljust(w) for x, w in zip(row, widths)))
+
+
+def bench_imports(args):
+    """Time `import main` against the eager imports main.py used to do"""
+    main_snippet = (
+        "import json, sys, time\n"
+        "t = time.perf_counter()\n"
+        "import main\n"
+        "elapsed = time.perf_counter() - t\n"
+        f"print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))\n"
+    )
+    eager_snippet = (
+        "import json, sys, time\n"
+        "t = time.perf_counter()\n"
+        "import torch, safetensors, diffusers, psutil\n"
+        "from diffusers import (StableDiffusionPipeline, StableDiffusionXLPipeline,\n"
+        "    StableVideoDiffusionPipeline, FluxPipeline, DPMSolverMultistepScheduler, DiffusionPipeline)\n"
+        "elapsed = time.perf_counter() - t\n"
+        f"print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))\n"
+    )
+
+    rows = []
+    for label, snippet in [("import main (lazy)", main_snippet), ("eager ML imports (old main.py)", eager_snippet)]:
+        times = []
+        loaded = []
+        for _ in range(args.repeat):
+            try:
+                result, _ = run_python(snippet, env={"PREWARM_ENABLED": "false"})
+            except RuntimeError as e:
+                times = None
+                loaded = [f"error: {e}"]
+                break
+            times.append(result["seconds"])
+            loaded = result["loaded"]
+        best = f"{min(times):.3f}s" if times else "n/a"
+        rows.append((label, best, ", ".join(loaded) or "-"))
+
+    print_table(["case", f"best of {args.repeat}", "heavy modules loaded"], rows)
+
+
+def parse_sizes(spec):
+    return [tuple(int(x) for x in item.lower().split("x")) for item in spec.split(",") if item.strip()]
+
+
+def time_call(fn, repeat=1):
+    """Best wall time of `fn()` over `repeat` runs, plus the RSS afterwards"""
+    from memory_utils import get_memory_usage
+
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, get_memory_usage()
+
+
+def load_benchmark_pipeline(model_name, task="txt2img"):
+    os.environ.setdefault("PREWARM_ENABLED", "false")
+    import main as api_main
+
+    pipe = api_main.load_model(model_name, task)
+    if pipe is None:
+        raise SystemExit(f"Model {model_name} not found in {api_main.MODEL_PATH}")
+    return api_main, pipe
+
+
+def bench_planner(args):
+    """Latency of the planner's choice against each fixed setting, per resolution"""
+    import torch
+    from planner import apply_request_plan
+
+    api_main, pipe = load_benchmark_pipeline(args.model)
+    model_mb = pipe._load_plan["model_mb"]
+
+    rows = []
+    for width, height in parse_sizes(args.sizes):
+        plan = api_main.execution_planner.plan(model_mb, width, height)
+        variants = [
+            ("planner", plan),
+            # The recipe load_model used to apply unconditionally (minus CPU offload,
+            # which current diffusers refuses without an accelerator)
+            ("old fixed recipe", dict(plan, attention_slicing="max", vae_slicing=True, vae_tiling=True)),
+            ("no slicing/tiling", dict(plan, attention_slicing=None, vae_slicing=False, vae_tiling=False)),
+            ("max attention slicing", dict(plan, attention_slicing="max")),
+            ("VAE tiling", dict(plan, vae_tiling=True)),
+        ]
+        for name, variant in variants:
+            apply_request_plan(pipe, variant)
+
+            def run():
+                with torch.no_grad():
+                    pipe(prompt="benchmark", num_inference_steps=args.steps, width=width, height=height,
+                         generator=torch.Generator(device="cpu").manual_seed(0))
+
+            seconds, rss = time_call(run, args.repeat)
+            rows.append((f"{width}x{height}", name, variant["attention_slicing"] or "-",
+                         "on" if variant["vae_tiling"] else "-", f"{seconds:.2f}s", f"{rss:.0f}MB"))
+
+    print(f"Model {args.model}, {args.steps} steps, threads {torch.get_num_threads()}")
+    print_table(["size", "variant", "attention slicing", "vae tiling", f"best of {args.repeat}", "rss"], rows)
+
+
+def image_similarity(a, b):
+    """PSNR (dB) and mean absolute difference (0-255) between two PIL images"""
+    import numpy as np
+
+    x = np.asarray(a, dtype=np.float64)
+    y = np.asarray(b, dtype=np.float64)
+    mse = float(np.mean((x - y) ** 2))
+    psnr = float("inf") if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+    return psnr, float(np.mean(np.abs(x - y)))
+
+
+def bench_precision(args):
+    """Latency and output similarity of the bf16/channels_last/compile modes vs fp32"""
+    import copy
+    import torch
+    from precision import apply_precision, inference_context
+
+    # The baseline must be plain fp32 whatever MODEL_OPTIONS says
+    os.environ["MODEL_OPTIONS"] = ""
+    api_main, baseline = load_benchmark_pipeline(args.model)
+    hardware = api_main.execution_planner.hardware
+
+    def generate(pipe):
+        with inference_context(pipe):
+            return pipe(prompt=args.prompt, num_inference_steps=args.steps, width=args.size, height=args.size,
+                        generator=torch.Generator(device="cpu").manual_seed(args.seed)).images[0]
+
+    reference = generate(baseline)
+    seconds, rss = time_call(lambda: generate(baseline), args.repeat)
+    rows = [("fp32 (baseline)", f"{seconds:.2f}s", "1.00x", "inf", "0.00", f"{rss:.0f}MB")]
+
+    for variant in args.modes.split(","):
+        options = {flag: True for flag in variant.split("+") if flag}
+        # Fresh copy of the weights, since the modes modify modules in place
+        pipe = baseline.__class__(**{name: copy.deepcopy(module) for name, module in baseline.components.items()})
+        try:
+            apply_precision(pipe, options, hardware)
+            image = generate(pipe)  # also pays the torch.compile cost outside the timing
+            variant_seconds, rss = time_call(lambda: generate(pipe), args.repeat)
+        except Exception as e:
+            rows.append((variant, "failed", "-", "-", "-", str(e)[:40]))
+            continue
+        psnr, mad = image_similarity(reference, image)
+        rows.append((variant, f"{variant_seconds:.2f}s", f"{seconds / variant_seconds:.2f}x",
+                     f"{psnr:.1f}", f"{mad:.2f}", f"{rss:.0f}MB"))
+        del pipe
+
+    print(f"Model {args.model}, {args.size}x{args.size}, {args.steps} steps, seed {args.seed}; "
+          f"AVX512-BF16={hardware['avx512_bf16']} AMX={hardware['amx']}")
+    print_table(["mode", f"best of {args.repeat}", "speedup", "PSNR dB", "mean abs diff", "rss"], rows)
+
+
+def bench_quantize(args):
+    """Memory, latency and fp32 similarity of the int8 "quantized" load option.
+
+    Exits non-zero when the PSNR against fp32 at the fixed seed drops below
+    --min-psnr, so it can run as a quality regression check.
+    """
+    import copy
+    import torch
+    from memory_utils import get_memory_usage
+    from precision import inference_context
+    from quantization import quantize_pipeline, quantized_cache_key
+
+    os.environ["MODEL_OPTIONS"] = ""
+    api_main, baseline = load_benchmark_pipeline(args.model)
+    checkpoint_path = os.path.join(api_main.MODEL_PATH, args.model)
+
+    def generate(pipe):
+        with inference_context(pipe):
+            return pipe(prompt=args.prompt, num_inference_steps=args.steps, width=args.size, height=args.size,
+                        generator=torch.Generator(device="cpu").manual_seed(args.seed)).images[0]
+
+    reference = generate(baseline)
+    seconds, rss = time_call(lambda: generate(baseline), args.repeat)
+
+    rss_before = get_memory_usage()
+    pipe = baseline.__class__(**{name: copy.deepcopy(module) for name, module in baseline.components.items()})
+    report = quantize_pipeline(pipe, api_main.QUANTIZED_CACHE_DIR, quantized_cache_key(checkpoint_path))
+    # A second pass exercises the disk cache path that later loads take
+    cached = baseline.__class__(**{name: copy.deepcopy(module) for name, module in baseline.components.items()})
+    cached_report = quantize_pipeline(cached, api_main.QUANTIZED_CACHE_DIR, quantized_cache_key(checkpoint_path))
+    del cached
+    rss_quantized = get_memory_usage() - rss_before
+
+    image = generate(pipe)
+    q_seconds, q_rss = time_call(lambda: generate(pipe), args.repeat)
+    psnr, mad = image_similarity(reference, image)
+
+    rows = []
+    for name, item in report.items():
+        rows.append((name, f"{item['linear_mb_before']}MB", f"{item['linear_mb_after']}MB", f"{item['saved_mb']}MB",
+                     f"{item['seconds']:.2f}s ({item['source']})",
+                     f"{cached_report[name]['seconds']:.2f}s ({cached_report[name]['source']})"))
+    print(f"Model {args.model}, {args.size}x{args.size}, {args.steps} steps, seed {args.seed}")
+    print_table(["component", "linear fp32", "linear int8", "saved", "first load", "next load"], rows)
+    print()
+    print_table(["mode", f"best of {args.repeat}", "speedup", "PSNR dB", "mean abs diff", "rss"], [
+        ("fp32 (baseline)", f"{seconds:.2f}s", "1.00x", "inf", "0.00", f"{rss:.0f}MB"),
+        ("int8 dynamic", f"{q_seconds:.2f}s", f"{seconds / q_seconds:.2f}x", f"{psnr:.1f}", f"{mad:.2f}",
+         f"{q_rss:.0f}MB (+{rss_quantized:.0f}MB for the copy)"),
+    ])
+
+    if psnr < args.min_psnr:
+        raise SystemExit(f"Quality regression: PSNR {psnr:.1f} dB against fp32 is below --min-psnr {args.min_psnr}")
+
+
+def bench_engines(args):
+    """Torch eager vs the ONNX Runtime engine: first call (export/session), steady latency, similarity"""
+    import copy
+    import torch
+    from engines import OnnxEngine
+    from precision import inference_context
+
+    os.environ["MODEL_OPTIONS"] = ""
+    api_main, baseline = load_benchmark_pipeline(args.model)
+    checkpoint_path = os.path.join(api_main.MODEL_PATH, args.model)
+
+    def generate(pipe):
+        with inference_context(pipe):
+            return pipe(prompt=args.prompt, num_inference_steps=args.steps, width=args.size, height=args.size,
+                        generator=torch.Generator(device="cpu").manual_seed(args.seed)).images[0]
+
+    reference = generate(baseline)
+    seconds, rss = time_call(lambda: generate(baseline), args.repeat)
+    rows = [("torch", "-", f"{seconds:.2f}s", "1.00x", "inf", "0.00", f"{rss:.0f}MB")]
+
+    for threads in [int(x) for x in args.onnx_threads.split(",")]:
+        engine = OnnxEngine(api_main.onnx_engine.cache_dir, intra_op_threads=threads)
+        pipe = baseline.__class__(**{name: copy.deepcopy(module) for name, module in baseline.components.items()})
+        pipe._load_plan = baseline._load_plan
+        engine.prepare(pipe, checkpoint_path)
+        started = time.perf_counter()
+        image = generate(pipe)  # exports on a cold cache, then opens the sessions
+        first = time.perf_counter() - started
+        onnx_seconds, rss = time_call(lambda: generate(pipe), args.repeat)
+        psnr, mad = image_similarity(reference, image)
+        rows.append((f"onnx ({threads or 'planner'} threads)", f"{first:.2f}s", f"{onnx_seconds:.2f}s",
+                     f"{seconds / onnx_seconds:.2f}x", f"{psnr:.1f}", f"{mad:.2f}", f"{rss:.0f}MB"))
+        del pipe
+
+    print(f"Model {args.model}, {args.size}x{args.size}, {args.steps} steps, seed {args.seed}, "
+          f"torch threads {torch.get_num_threads()}")
+    print_table(["engine", "first call", f"best of {args.repeat}", "speedup", "PSNR dB", "mean abs diff", "rss"], rows)
+
+
+def bench_workers(args):
+    """Memory of N processes holding the same model, with and without shared weights.
+
+    RSS counts shared pages in every process, so the table also reports PSS
+    (shared pages split between the processes that map them, i.e. the real
+    footprint) and USS (pages only that process holds).
+    """
+    from memory_utils import psutil
+
+    if psutil is None:
+        raise SystemExit("psutil is required for the workers benchmark")
+
+    snippet = (
+        "import json, os, sys, torch\n"
+        "import main\n"
+        f"pipe = main.load_model({args.model!r}, 'txt2img')\n"
+        "with torch.no_grad():\n"
+        f"    pipe(prompt='benchmark', num_inference_steps=2, width={args.size}, height={args.size})\n"
+        "print(json.dumps({'pid': os.getpid()}), flush=True)\n"
+        "sys.stdin.read()\n"
+    )
+
+    rows = []
+    for shared in ("true", "false"):
+        for workers in range(1, args.max_workers + 1):
+            env = dict(os.environ, SHARED_WEIGHTS=shared, PREWARM_ENABLED="false", JOB_WORKERS=str(workers))
+            procs = [subprocess.Popen([sys.executable, "-c", snippet], cwd=API_DIR, env=env, text=True,
+                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                     for _ in range(workers)]
+            try:
+                infos = []
+                for proc in procs:
+                    # Skip main.py's load logs up to the JSON line
+                    line = proc.stdout.readline()
+                    while line and not line.startswith('{"pid"'):
+                        line = proc.stdout.readline()
+                    if not line:
+                        raise SystemExit(f"A benchmark worker exited early (exit code {proc.wait()})")
+                    infos.append(psutil.Process(json.loads(line)["pid"]).memory_full_info())
+            finally:
+                for proc in procs:
+                    proc.stdin.close()
+                    proc.wait()
+            mb = 1024 * 1024
+            rows.append(("on" if shared == "true" else "off", workers,
+                         f"{sum(i.rss for i in infos) / mb:.0f}MB", f"{sum(i.pss for i in infos) / mb:.0f}MB",
+                         f"{sum(i.uss for i in infos) / mb:.0f}MB", f"{infos[0].uss / mb:.0f}MB"))
+
+    print(f"Model {args.model}, every process loaded it and ran one {args.size}x{args.size} generation")
+    print_table(["shared weights", "processes", "total RSS", "total PSS", "total USS", "USS per process"], rows)
+
+
+def bench_schedulers(args):
+    """Latency versus steps per scheduler, and how far each run is from that scheduler at the most steps"""
+    import torch
+    from precision import inference_context
+    from schedulers import SCHEDULERS, select_scheduler
+
+    api_main, pipe = load_benchmark_pipeline(args.model)
+    names = ["default"] + list(SCHEDULERS) if args.schedulers == "all" else args.schedulers.split(",")
+    step_counts = sorted(int(x) for x in args.steps.split(","))
+
+    rows = []
+    for name in names:
+        images, timings = {}, {}
+        for steps in step_counts:
+            with pipe._generation_lock, inference_context(pipe):
+                select_scheduler(pipe, name)
+
+                def run():
+                    images[steps] = pipe(prompt=args.prompt, num_inference_steps=steps, guidance_scale=args.cfg,
+                                         width=args.size, height=args.size,
+                                         generator=torch.Generator(device="cpu").manual_seed(args.seed)).images[0]
+
+                timings[steps], _ = time_call(run, args.repeat)
+        for steps in step_counts:
+            psnr, _ = image_similarity(images[step_counts[-1]], images[steps])
+            rows.append((name, steps, f"{timings[steps]:.2f}s", f"{timings[steps] / steps:.3f}s", f"{psnr:.1f}"))
+        with pipe._generation_lock:
+            select_scheduler(pipe, None)
+
+    print(f"Model {args.model}, {args.size}x{args.size}, cfg {args.cfg}, seed {args.seed}")
+    print_table(["scheduler", "steps", f"best of {args.repeat}", "per step",
+                 f"PSNR vs {step_counts[-1]} steps"], rows)
+
+
+def synthetic_photo(width, height, seed=0):
+    """Smooth gradients plus sensor-like noise: compresses and decodes like a camera photo"""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([x / width * 255, y / height * 255, (x + y) / (width + height) * 255], axis=-1)
+    noisy = base + rng.normal(0, 12, size=base.shape).astype(np.float32)
+    return Image.fromarray(np.clip(noisy, 0, 255).astype(np.uint8))
+
+
+def bench_upload(args):
+    """Init-image preprocessing: base64 data URL + full decode + LANCZOS vs raw bytes + draft/reduce decode"""
+    import base64
+    from io import BytesIO
+    from PIL import Image
+    from image_input import fit_within, image_size, load_init_image
+
+    (width, height), = parse_sizes(args.photo)
+    photo = synthetic_photo(width, height)
+    sources = {}
+    for fmt in args.formats.split(","):
+        buffer = BytesIO()
+        photo.save(buffer, format=fmt.upper(), **({"quality": 90} if fmt.lower() == "jpeg" else {}))
+        sources[fmt.lower()] = buffer.getvalue()
+    del photo
+
+    targets = {
+        "img2img": lambda size: fit_within(size, 768),
+        "svd": lambda size: (1024, 576),
+        "fallback": lambda size: (384, 384),
+    }
+
+    rows = []
+    for fmt, data in sources.items():
+        data_url = f"data:image/{fmt};base64," + base64.b64encode(data).decode("ascii")
+        for name, target in targets.items():
+            results = {}
+
+            def legacy():
+                encoded = data_url.split(",", 1)[1]
+                image = Image.open(BytesIO(base64.b64decode(encoded))).convert("RGB")
+                results["legacy"] = image.resize(target(image.size), resample=Image.LANCZOS)
+
+            def upload():
+                results["upload"] = load_init_image(data, target(image_size(data)))
+
+            legacy_seconds, _ = time_call(legacy, args.repeat)
+            upload_seconds, _ = time_call(upload, args.repeat)
+            psnr, _ = image_similarity(results["legacy"], results["upload"])
+            rows.append((fmt, name, "x".join(map(str, results["upload"].size)),
+                         f"{len(data_url) / 1e6:.1f}MB", f"{len(data) / 1e6:.1f}MB",
+                         f"{legacy_seconds * 1000:.0f}ms", f"{upload_seconds * 1000:.0f}ms",
+                         f"{legacy_seconds / upload_seconds:.1f}x", f"{psnr:.1f}"))
+
+    print(f"Synthetic {width}x{height} photo, best of {args.repeat}")
+    print_table(["format", "target", "size", "data URL", "upload", "data URL path", "upload path", "speedup",
+                 "PSNR vs data URL path"], rows)
+
+
+def bench_outputs(args):
+    """Encode time and file size of one output image per format / PNG compress level"""
+    from PIL import Image
+    from output_writer import OutputWriter
+
+    if args.image:
+        image = Image.open(args.image).convert("RGB")
+    else:
+        (width, height), = parse_sizes(args.size)
+        image = synthetic_photo(width, height)
+
+    variants = [("png", {"png_compress_level": level}, f"compress_level={level}")
+                for level in (int(x) for x in args.png_levels.split(","))]
+    variants += [("webp", {"webp_method": method}, f"quality={args.quality} method={method}")
+                 for method in (int(x) for x in args.webp_methods.split(","))]
+    variants += [("webp_lossless", {"webp_method": 0}, "method=0"), ("jpeg", {}, f"quality={args.quality}")]
+
+    rows = []
+    reference = None
+    for fmt, options, label in variants:
+        writer = OutputWriter(webp_quality=args.quality, jpeg_quality=args.quality, **options)
+        data = {}
+        seconds, _ = time_call(lambda: data.update(bytes=writer.encode(image, fmt)), args.repeat)
+        decoded = Image.open(__import__("io").BytesIO(data["bytes"])).convert("RGB")
+        psnr, _ = image_similarity(image, decoded)
+        reference = reference or seconds
+        rows.append((fmt, label, f"{seconds * 1000:.0f}ms", f"{len(data['bytes']) / 1024:.0f}KB",
+                     "lossless" if psnr == float("inf") else f"{psnr:.1f}"))
+
+    print(f"{image.size[0]}x{image.size[1]} image, best of {args.repeat}")
+    print_table(["format", "settings", "encode", "size", "PSNR"], rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("imports", help="import time of main.py vs the eager ML imports")
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_imports)
+
+    p = sub.add_parser("planner", help="execution planner defaults vs fixed attention/VAE settings")
+    p.add_argument("--model", required=True, help="checkpoint file name in MODEL_PATH")
+    p.add_argument("--sizes", default="512x512,768x768,1024x1024")
+    p.add_argument("--steps", type=int, default=4)
+    p.add_argument("--repeat", type=int, default=1)
+    p.set_defaults(func=bench_planner)
+
+    p = sub.add_parser("precision", help="bf16 / channels_last / torch.compile vs fp32 latency and similarity")
+    p.add_argument("--model", required=True, help="checkpoint file name in MODEL_PATH")
+    p.add_argument("--modes", default="channels_last,bf16_autocast,bf16,bf16+channels_last,compile")
+    p.add_argument("--size", type=int, default=512)
+    p.add_argument("--steps", type=int, default=10)
+    p.add_argument("--seed", type=int, default=1234)
+    p.add_argument("--prompt", default="a photo of a red fox in the snow, detailed")
+    p.add_argument("--repeat", type=int, default=1)
+    p.set_defaults(func=bench_precision)
+
+    p = sub.add_parser("quantize", help="int8 dynamic quantization: memory saved, speedup and fp32 similarity")
+    p.add_argument("--model", required=True, help="checkpoint file name in MODEL_PATH")
+    p.add_argument("--size", type=int, default=512)
+    p.add_argument("--steps", type=int, default=10)
+    p.add_argument("--seed", type=int, default=1234)
+    p.add_argument("--prompt", default="a photo of a red fox in the snow, detailed")
+    p.add_argument("--repeat", type=int, default=1)
+    p.add_argument("--min-psnr", type=float, default=0.0, help="fail when PSNR against fp32 is lower (dB)")
+    p.set_defaults(func=bench_quantize)
+
+    p = sub.add_parser("engines", help="torch vs ONNX Runtime engine latency and similarity")
+    p.add_argument("--model", required=True, help="checkpoint file name in MODEL_PATH")
+    p.add_argument("--size", type=int, default=512)
+    p.add_argument("--steps", type=int, default=10)
+    p.add_argument("--seed", type=int, default=1234)
+    p.add_argument("--prompt", default="a photo of a red fox in the snow, detailed")
+    p.add_argument("--repeat", type=int, default=1)
+    p.add_argument("--onnx-threads", default="0", help="comma-separated intra-op thread counts, 0 = planner")
+    p.set_defaults(func=bench_engines)
+
+    p = sub.add_parser("workers", help="memory of N processes holding one model, shared weights on/off")
+    p.add_argument("--model", required=True, help="checkpoint file name in MODEL_PATH")
+    p.add_argument("--max-workers", type=int, default=3)
+    p.add_argument("--size", type=int, default=256)
+    p.set_defaults(func=bench_workers)
+
+    p = sub.add_parser("schedulers", help="latency versus steps for each request scheduler")
+    p.add_argument("--model", required=True, help="checkpoint file name in MODEL_PATH")
+    p.add_argument("--schedulers", default="all", help="comma-separated names, or all")
+    p.add_argument("--steps", default="10,20,30")
+    p.add_argument("--size", type=int, default=512)
+    p.add_argument("--cfg", type=float, default=7.0)
+    p.add_argument("--seed", type=int, default=1234)
+    p.add_argument("--prompt", default="a photo of a red fox in the snow, detailed")
+    p.add_argument("--repeat", type=int, default=1)
+    p.set_defaults(func=bench_schedulers)
+
+    p = sub.add_parser("upload", help="init-image decode and resize: data URL path vs raw upload with draft decoding")
+    p.add_argument("--photo", default="4032x3024", help="synthetic photo size, WIDTHxHEIGHT")
+    p.add_argument("--formats", default="jpeg,png")
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_upload)
+
+    p = sub.add_parser("outputs", help="output encoding time and size per format and PNG compress level")
+    p.add_argument("--image", help="image to encode (default: synthetic photo of --size)")
+    p.add_argument("--size", default="1024x1024")
+    p.add_argument("--png-levels", default="1,3,6,9")
+    p.add_argument("--webp-methods", default="0,4,6")
+    p.add_argument("--quality", type=int, default=90)
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_outputs)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+# Bytes hashed from the start and the end of a checkpoint for its fingerprint
+FINGERPRINT_SAMPLE_BYTES = 16 * 1024 * 1024
+
+
+def checkpoint_fingerprint(checkpoint_path):
+    """Cheap content fingerprint of a checkpoint file.
+
+    Hashing a multi-GB file on every start would cost more than it saves, so
+    this hashes the file size, the safetensors header and the first and last
+    16 MB of tensor data. Any re-export or fine-tune changes those bytes.
+    """
+    digest = hashlib.sha256()
+    size = os.path.getsize(checkpoint_path)
+    digest.update(str(size).encode("ascii"))
+    with open(checkpoint_path, "rb") as f:
+        digest.update(f.read(FINGERPRINT_SAMPLE_BYTES))
+        if size > FINGERPRINT_SAMPLE_BYTES * 2:
+            f.seek(-FINGERPRINT_SAMPLE_BYTES, os.SEEK_END)
+            digest.update(f.read(FINGERPRINT_SAMPLE_BYTES))
+    return digest.hexdigest()[:16]
+
+
+class ConvertedCheckpointCache:
+    """Stores single-file checkpoints converted to diffusers format.
+
+    The first load runs `from_single_file` (key conversion plus config
+    inference) and writes the resulting components with `save_pretrained`
+    as safetensors. Later loads of the same checkpoint content with the same
+    diffusers version go through `from_pretrained`, which memory-maps those
+    files instead of converting again.
+    """
+
+    def __init__(self, cache_dir, enabled=True):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.reports = []
+        self._lock = threading.Lock()
+
+    def converted_dir(self, checkpoint_path):
+        import diffusers
+
+        stem = os.path.splitext(os.path.basename(checkpoint_path))[0]
+        fingerprint = checkpoint_fingerprint(checkpoint_path)
+        return os.path.join(self.cache_dir, f"{stem}-{fingerprint}-diffusers{diffusers.__version__}")
+
+    def load(self, cls, checkpoint_path, **kwargs):
+        """Load `cls` for a checkpoint, converting it into the cache on first use"""
+        if not self.enabled:
+            started = time.time()
+            pipe = cls.from_single_file(checkpoint_path, **kwargs)
+            self._report(checkpoint_path, "single_file", load_seconds=time.time() - started)
+            return pipe
+
+        started = time.time()
+        target_dir = self.converted_dir(checkpoint_path)
+        fingerprint_seconds = time.time() - started
+
+        if os.path.exists(os.path.join(target_dir, "model_index.json")):
+            started = time.time()
+            pipe = cls.from_pretrained(target_dir, torch_dtype=kwargs.get("torch_dtype"), local_files_only=True)
+            self._report(checkpoint_path, "converted_cache", load_seconds=time.time() - started,
+                         fingerprint_seconds=fingerprint_seconds, path=target_dir)
+            return pipe
+
+        started = time.time()
+        pipe = cls.from_single_file(checkpoint_path, **kwargs)
+        convert_seconds = time.time() - started
+
+        started = time.time()
+        try:
+            self._save(pipe, checkpoint_path, target_dir)
+        except Exception as e:
+            print(f"Could not write converted checkpoint cache for {checkpoint_path}: {e}")
+        self._report(checkpoint_path, "converted_now", convert_seconds=convert_seconds,
+                     save_seconds=time.time() - started, fingerprint_seconds=fingerprint_seconds,
+                     path=target_dir)
+        return pipe
+
+    def stats(self):
+        with self._lock:
+            return {"enabled": self.enabled, "cache_dir": self.cache_dir, "loads": list(self.reports)}
+
+    def _save(self, pipe, checkpoint_path, target_dir):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_dir = f"{target_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        pipe.save_pretrained(tmp_dir, safe_serialization=True)
+        with open(os.path.join(tmp_dir, "conversion.json"), "w") as f:
+            json.dump({"source": os.path.abspath(checkpoint_path), "created_at": time.time()}, f)
+        if os.path.exists(target_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        else:
+            os.replace(tmp_dir, target_dir)
+
+    def _report(self, checkpoint_path, source, **timings):
+        report = {"model": os.path.basename(checkpoint_path), "source": source}
+        report.update({k: round(v, 2) if isinstance(v, float) else v for k, v in timings.items()})
+        with self._lock:
+            self.reports.append(report)
+        details = ", ".join(f"{k}={v}" for k, v in report.items() if k.endswith("_seconds"))
+        print(f"Checkpoint load report: {report['model']} via {source} ({details})")
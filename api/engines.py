@@ -0,0 +1,253 @@
+import os
+import threading
+import time
+
+from checkpoint_cache import checkpoint_fingerprint
+
+# Inference engines selectable per model with the MODEL_OPTIONS "engine:<name>" option
+ENGINE_NAMES = ("torch", "onnx")
+
+
+class TorchEngine:
+    """Default engine: the pipeline's own PyTorch modules run as loaded"""
+
+    name = "torch"
+
+    def prepare(self, pipe, checkpoint_path):
+        pipe._engine = self.name
+        return {}
+
+    def stats(self):
+        return {}
+
+
+class OnnxEngine:
+    """Runs UNet, VAE decoder and text encoder through ONNX Runtime CPU sessions.
+
+    The diffusers pipeline keeps its scheduler and pre/post-processing; only
+    the forward passes of those modules are redirected to onnxruntime. Each
+    module is exported on first use per shape bucket (latent size; batch stays
+    dynamic) to `<cache_dir>/<checkpoint>-<fingerprint>-<component>-<bucket>/`,
+    and later loads just open the cached file. Calls the export does not cover
+    (ControlNet residuals, LCM timestep conditioning, hidden-state outputs,
+    tiled VAE decode) fall through to the original torch forward.
+    """
+
+    name = "onnx"
+
+    def __init__(self, cache_dir, intra_op_threads=0, inter_op_threads=1):
+        self.cache_dir = cache_dir
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.exports = []
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+
+    def prepare(self, pipe, checkpoint_path):
+        """Redirect the supported modules of a freshly loaded pipeline to onnxruntime"""
+        import onnxruntime  # noqa: F401  fail at load time rather than on the first request
+
+        if type(pipe).__name__ == "StableVideoDiffusionPipeline":
+            # The export covers 2D UNets only; SVD's spatio-temporal UNet stays on torch
+            print("ONNX engine does not support video pipelines, running on torch")
+            pipe._engine = "torch"
+            return {"components": []}
+
+        stem = os.path.splitext(os.path.basename(checkpoint_path))[0]
+        prefix = f"{stem}-{checkpoint_fingerprint(checkpoint_path)}"
+        plan = getattr(pipe, "_load_plan", None) or {}
+        threads = self.intra_op_threads or plan.get("threads", 0)
+
+        patched = []
+        unet = getattr(pipe, "unet", None)
+        if unet is not None:
+            self._patch_unet(unet, f"{prefix}-unet", threads)
+            patched.append("unet")
+        vae = getattr(pipe, "vae", None)
+        if vae is not None:
+            self._patch_vae_decode(vae, f"{prefix}-vae_decoder", threads)
+            patched.append("vae_decoder")
+        text_encoder = getattr(pipe, "text_encoder", None)
+        if text_encoder is not None and type(text_encoder).__name__ == "CLIPTextModel":
+            self._patch_text_encoder(text_encoder, f"{prefix}-text_encoder", threads)
+            patched.append("text_encoder")
+
+        pipe._engine = self.name if patched else "torch"
+        return {"components": patched, "intra_op_threads": threads, "inter_op_threads": self.inter_op_threads}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "cache_dir": self.cache_dir,
+                "intra_op_threads": self.intra_op_threads,
+                "inter_op_threads": self.inter_op_threads,
+                "sessions": sorted(os.path.basename(os.path.dirname(path)) for path in self._sessions),
+                "exports": list(self.exports),
+            }
+
+    def _patch_unet(self, unet, prefix, threads):
+        import torch
+
+        original_forward = unet.forward
+        sdxl = getattr(unet.config, "addition_embed_type", None) == "text_time"
+
+        class Exported(torch.nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.unet = unet
+
+            def forward(self, sample, timestep, encoder_hidden_states, text_embeds=None, time_ids=None):
+                added = {"text_embeds": text_embeds, "time_ids": time_ids} if sdxl else None
+                return original_forward(sample, timestep, encoder_hidden_states,
+                                        added_cond_kwargs=added, return_dict=False)[0]
+
+        def forward(sample, timestep, encoder_hidden_states, **kwargs):
+            added_cond_kwargs = kwargs.get("added_cond_kwargs")
+            return_dict = kwargs.get("return_dict", True)
+            if any(value is not None for name, value in kwargs.items()
+                   if name not in ("added_cond_kwargs", "return_dict")):
+                # Only forward what the caller passed: other UNets don't take every UNet2DConditionModel kwarg
+                return original_forward(sample, timestep, encoder_hidden_states, **kwargs)
+
+            batch = sample.shape[0]
+            inputs = {
+                "sample": sample,
+                "timestep": torch.as_tensor(timestep, dtype=torch.float32).reshape(-1).expand(batch),
+                "encoder_hidden_states": encoder_hidden_states,
+            }
+            if sdxl:
+                inputs["text_embeds"] = added_cond_kwargs["text_embeds"]
+                inputs["time_ids"] = added_cond_kwargs["time_ids"]
+            bucket = f"{sample.shape[2]}x{sample.shape[3]}"
+            session = self._session(f"{prefix}-{bucket}", Exported(), inputs, threads)
+            output = self._run(session, inputs, sample)
+            if not return_dict:
+                return (output,)
+            from diffusers.models.unets.unet_2d_condition import UNet2DConditionOutput
+            return UNet2DConditionOutput(sample=output)
+
+        unet.forward = forward
+
+    def _patch_vae_decode(self, vae, prefix, threads):
+        import torch
+
+        original_decode = vae.decode
+
+        class Exported(torch.nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.vae = vae
+
+            def forward(self, latents):
+                return original_decode(latents, return_dict=False)[0]
+
+        def decode(z, return_dict=True, **kwargs):
+            # Tiled decode exists for sizes that don't fit in memory at once; keep it on torch.
+            # AutoencoderKL ignores the generator pipelines pass along.
+            if getattr(vae, "use_tiling", False) or any(name != "generator" for name in kwargs):
+                return original_decode(z, return_dict=return_dict, **kwargs)
+            inputs = {"latents": z}
+            session = self._session(f"{prefix}-{z.shape[2]}x{z.shape[3]}", Exported(), inputs, threads)
+            output = self._run(session, inputs, z)
+            if not return_dict:
+                return (output,)
+            from diffusers.models.autoencoders.vae import DecoderOutput
+            return DecoderOutput(sample=output)
+
+        vae.decode = decode
+
+    def _patch_text_encoder(self, text_encoder, prefix, threads):
+        import torch
+
+        original_forward = text_encoder.forward
+
+        class Exported(torch.nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.text_encoder = text_encoder
+
+            def forward(self, input_ids):
+                output = original_forward(input_ids, return_dict=False)
+                return output[0], output[1]
+
+        def forward(input_ids=None, attention_mask=None, output_hidden_states=None, **kwargs):
+            # clip_skip and SDXL-style callers need hidden states the export doesn't return
+            if attention_mask is not None or output_hidden_states or input_ids is None:
+                return original_forward(input_ids=input_ids, attention_mask=attention_mask,
+                                        output_hidden_states=output_hidden_states, **kwargs)
+            inputs = {"input_ids": input_ids.to(torch.int64)}
+            session = self._session(f"{prefix}-{input_ids.shape[1]}", Exported(), inputs, threads)
+            hidden, pooled = session.run(None, {name: value.cpu().numpy() for name, value in inputs.items()})
+            # Indexable like the tuple (`[0]`) and readable by attribute (Flux reads `.pooler_output`)
+            from transformers.modeling_outputs import BaseModelOutputWithPooling
+            return BaseModelOutputWithPooling(last_hidden_state=torch.from_numpy(hidden),
+                                              pooler_output=torch.from_numpy(pooled))
+
+        text_encoder.forward = forward
+
+    def _session(self, key, module, inputs, threads):
+        """Open (exporting first if needed) the onnxruntime session for one shape bucket"""
+        # One directory per artifact: models over 2GB keep their weights as external data files
+        path = os.path.join(self.cache_dir, key, "model.onnx")
+        with self._lock:
+            session = self._sessions.get(path)
+        if session is not None:
+            return session
+
+        import onnxruntime
+
+        with self._open_lock:
+            if path in self._sessions:
+                return self._sessions[path]
+            if not os.path.exists(path):
+                self._export(path, module, inputs)
+
+            options = onnxruntime.SessionOptions()
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+            if threads:
+                options.intra_op_num_threads = threads
+            options.inter_op_num_threads = self.inter_op_threads
+            started = time.time()
+            session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+            print(f"ONNX Runtime session for {key} opened in {time.time() - started:.1f}s")
+            with self._lock:
+                self._sessions[path] = session
+        return session
+
+    def _export(self, path, module, inputs):
+        import shutil
+        import torch
+
+        target_dir = os.path.dirname(path)
+        key = os.path.basename(target_dir)
+        tmp_dir = f"{target_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        started = time.time()
+        names = list(inputs)
+        with torch.no_grad():
+            torch.onnx.export(
+                module.eval(),
+                tuple(value.detach().float() if value.is_floating_point() else value for value in inputs.values()),
+                os.path.join(tmp_dir, "model.onnx"),
+                input_names=names,
+                # Batch stays dynamic (CFG doubles it, batched jobs multiply it); spatial size is the bucket
+                dynamic_axes={name: {0: "batch"} for name in names},
+                opset_version=17,
+                dynamo=False,
+            )
+        shutil.rmtree(target_dir, ignore_errors=True)
+        os.replace(tmp_dir, target_dir)
+        seconds = round(time.time() - started, 2)
+        with self._lock:
+            self.exports.append({"artifact": key, "export_seconds": seconds})
+        print(f"Exported {key} to ONNX in {seconds}s")
+
+    def _run(self, session, inputs, like):
+        import torch
+
+        feeds = {name: value.detach().to("cpu", torch.float32).contiguous().numpy() for name, value in inputs.items()}
+        output = session.run(None, feeds)[0]
+        return torch.from_numpy(output).to(like.device, like.dtype)
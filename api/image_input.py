@@ -0,0 +1,47 @@
+import base64
+from io import BytesIO
+
+from PIL import Image
+
+
+def data_url_bytes(value):
+    """Bytes of a base64 data URL ("data:image/png;base64,...") or of bare base64"""
+    if "," in value:
+        value = value.split(",", 1)[1]
+    return base64.b64decode(value)
+
+
+def image_size(data):
+    """(width, height) from the image header, without decoding pixels; raises on non-images"""
+    with Image.open(BytesIO(data)) as image:
+        return image.size
+
+
+def fit_within(size, max_dim, multiple=8):
+    """Scale (width, height) down to fit max_dim, rounded down to a multiple of `multiple`"""
+    width, height = size
+    if width > max_dim or height > max_dim:
+        ratio = min(max_dim / width, max_dim / height)
+        width, height = int(width * ratio), int(height * ratio)
+    return max(multiple, width - width % multiple), max(multiple, height - height % multiple)
+
+
+def load_init_image(data, size):
+    """Decode image bytes to an RGB image of exactly `size` (width, height), cheaply.
+
+    JPEGs are decoded in draft mode, which lets libjpeg produce a 1/2, 1/4
+    or 1/8 scale image straight from the DCT coefficients (never smaller
+    than `size`). Other formats are box-reduced by the largest integer
+    factor that stays at or above `size`. Only the final, small step is a
+    LANCZOS resize, so a 12 MP photo never exists at full resolution in RGB.
+    """
+    image = Image.open(BytesIO(data))
+    if image.format == "JPEG":
+        image.draft("RGB", size)
+    image = image.convert("RGB")
+    factor = min(image.width // size[0], image.height // size[1])
+    if factor >= 2:
+        image = image.reduce(factor)
+    if image.size != tuple(size):
+        image = image.resize(tuple(size), resample=Image.LANCZOS)
+    return image
@@ -0,0 +1,77 @@
+FRAME_INTERPOLATION_METHODS = ("none", "slerp", "flow")
+
+
+def normalize_interpolation_method(name):
+    """Validate a FALLBACK_VIDEO_INTERPOLATION value"""
+    method = (name or "none").strip().lower()
+    if method not in FRAME_INTERPOLATION_METHODS:
+        raise ValueError(f"Unknown frame interpolation {name!r}, expected one of: "
+                         f"{', '.join(FRAME_INTERPOLATION_METHODS)}")
+    return method
+
+
+def slerp(a, b, t):
+    """Spherical interpolation between two latent tensors (linear when nearly parallel)"""
+    import torch
+
+    a32, b32 = a.float(), b.float()
+    dot = (a32.flatten() / a32.norm()).dot(b32.flatten() / b32.norm()).clamp(-1.0, 1.0)
+    theta = torch.acos(dot)
+    if theta.abs() < 1e-4:
+        mixed = (1 - t) * a32 + t * b32
+    else:
+        sin_theta = torch.sin(theta)
+        mixed = (torch.sin((1 - t) * theta) / sin_theta) * a32 + (torch.sin(t * theta) / sin_theta) * b32
+    return mixed.to(a.dtype)
+
+
+def inbetween_times(inbetweens):
+    """Times in (0, 1) of the frames synthesized between two keyframes"""
+    return [(i + 1) / (inbetweens + 1) for i in range(inbetweens)]
+
+
+def interpolate_latents(keyframes, inbetweens):
+    """Keyframe latents (channels, h, w) with `inbetweens` slerped latents between each pair"""
+    frames = []
+    for a, b in zip(keyframes, keyframes[1:]):
+        frames.append(a)
+        frames.extend(slerp(a, b, t) for t in inbetween_times(inbetweens))
+    frames.append(keyframes[-1])
+    return frames
+
+
+def _warp(image, flow, scale):
+    import cv2
+    import numpy as np
+
+    height, width = flow.shape[:2]
+    grid_x, grid_y = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+    return cv2.remap(image, grid_x + flow[..., 0] * scale, grid_y + flow[..., 1] * scale,
+                     interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+
+
+def interpolate_flow(keyframes, inbetweens):
+    """Yield keyframe images with `inbetweens` optical-flow interpolated images between each pair.
+
+    Dense Farneback flow is computed both ways between neighbouring
+    keyframes; an in-between at time t pulls pixels from the first frame
+    along t of the backward flow and from the second along 1 - t of the
+    forward flow, then blends the two warps by distance in time.
+    """
+    import cv2
+    import numpy as np
+    from PIL import Image
+
+    arrays = [np.asarray(frame.convert("RGB")) for frame in keyframes]
+    grays = [cv2.cvtColor(array, cv2.COLOR_RGB2GRAY) for array in arrays]
+    for index in range(len(arrays) - 1):
+        first, second = arrays[index], arrays[index + 1]
+        forward = cv2.calcOpticalFlowFarneback(grays[index], grays[index + 1], None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        backward = cv2.calcOpticalFlowFarneback(grays[index + 1], grays[index], None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        yield keyframes[index]
+        for t in inbetween_times(inbetweens):
+            from_first = _warp(first, backward, t).astype(np.float32)
+            from_second = _warp(second, forward, 1 - t).astype(np.float32)
+            blended = (1 - t) * from_first + t * from_second
+            yield Image.fromarray(np.clip(blended + 0.5, 0, 255).astype(np.uint8))
+    yield keyframes[-1]
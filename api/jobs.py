@@ -0,0 +1,272 @@
+import contextlib
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict, deque
+
+
+# The jobs being executed by the current worker thread
+_worker_state = threading.local()
+
+
+def current_jobs():
+    """Return the Jobs running on this thread (empty outside job workers)"""
+    return list(getattr(_worker_state, "jobs", []))
+
+
+@contextlib.contextmanager
+def bound_jobs(jobs):
+    """Make `jobs` what current_jobs() returns on this thread while the block runs"""
+    _worker_state.jobs = list(jobs)
+    try:
+        yield
+    finally:
+        _worker_state.jobs = []
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class Job:
+    def __init__(self, request):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.state = "queued"  # queued -> running -> succeeded | failed
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.progress = None
+        # Set while the result waits for a pending output write
+        self.deferred = False
+        self.updated_at = self.created_at
+        # Bumped on every state or progress change so streams know when to emit
+        self.version = 0
+        self._done = threading.Event()
+
+    def update_progress(self, progress):
+        self.progress = progress
+        self.touch()
+
+    def touch(self):
+        self.updated_at = time.time()
+        self.version += 1
+
+    def wait(self, timeout=None):
+        """Block until the job finished; returns False on timeout"""
+        return self._done.wait(timeout)
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def to_dict(self):
+        now = time.time()
+        queue_end = self.started_at or self.finished_at or now
+        return {
+            "id": self.id,
+            "state": self.state,
+            "mode": getattr(self.request, "mode", None),
+            "model_name": getattr(self.request, "model_name", None),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_seconds": round(queue_end - self.created_at, 3),
+            "run_seconds": round((self.finished_at or now) - self.started_at, 3) if self.started_at else None,
+            "result": self.result,
+            "url": self.result.get("url") if isinstance(self.result, dict) else None,
+            "error": self.error,
+            "progress": self.progress,
+            "seconds_since_update": round(now - self.updated_at, 3),
+        }
+
+
+class JobQueue:
+    """Bounded FIFO of generation jobs executed by background worker threads.
+
+    `handler(request)` runs on a worker thread, never on the event loop, and
+    its return value becomes the job result. A result dict with
+    status == "error" marks the job as failed.
+
+    When `batch_key(request)` returns a key, the worker waits up to
+    `batch_window` seconds for more queued jobs with the same key and hands
+    up to `max_batch_size` requests to `batch_handler(requests)`, which
+    returns one result per request.
+
+    A result dict may carry a concurrent.futures.Future under "pending" (an
+    output file still being written): the worker moves on to the next job
+    and the job finishes when the future does, failing if it raised.
+    """
+
+    def __init__(self, handler, workers=1, max_queue=16, history=200,
+                 batch_handler=None, batch_key=None, max_batch_size=1, batch_window=0.05):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.history = history
+        self.batch_handler = batch_handler
+        self.batch_key = batch_key
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_window = batch_window
+        self._pending = deque()
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._has_pending = threading.Condition(self._lock)
+        self._threads = []
+        self.running = 0
+        self.batches = 0
+        self.batched_jobs = 0
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            print(f"Started {self.workers} job worker(s), queue limit {self.max_queue}, "
+                  f"max batch {self.max_batch_size}")
+
+    def submit(self, request):
+        self.start()
+        job = Job(request)
+        with self._lock:
+            if len(self._pending) >= self.max_queue:
+                raise QueueFullError(f"Job queue is full ({self.max_queue} pending)")
+            self._pending.append(job)
+            self._jobs[job.id] = job
+            self._trim_history()
+            self._has_pending.notify_all()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def position(self, job):
+        """1-based position of a queued job, 0 once it has started"""
+        with self._lock:
+            if job in self._pending:
+                return self._pending.index(job) + 1
+        return 0
+
+    def stats(self):
+        with self._lock:
+            states = {}
+            for job in self._jobs.values():
+                states[job.state] = states.get(job.state, 0) + 1
+            return {
+                "workers": self.workers,
+                "running": self.running,
+                "queued": len(self._pending),
+                "max_queue": self.max_queue,
+                "max_batch_size": self.max_batch_size,
+                "batches": self.batches,
+                "batched_jobs": self.batched_jobs,
+                "jobs": states,
+            }
+
+    def _trim_history(self):
+        # Forget the oldest finished jobs once we track more than `history`
+        excess = len(self._jobs) - self.history
+        for job_id in [j.id for j in self._jobs.values() if j.done][:max(excess, 0)]:
+            del self._jobs[job_id]
+
+    def _key_for(self, job):
+        if self.batch_handler is None or self.batch_key is None or self.max_batch_size <= 1:
+            return None
+        return self.batch_key(job.request)
+
+    def _take_batch(self):
+        """Pop the next job plus compatible queued jobs (caller holds the lock)"""
+        while not self._pending:
+            self._has_pending.wait()
+        batch = [self._pending.popleft()]
+        key = self._key_for(batch[0])
+        if key is None:
+            return batch, None
+
+        deadline = time.time() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            for job in list(self._pending):
+                if len(batch) >= self.max_batch_size:
+                    break
+                if self._key_for(job) == key:
+                    self._pending.remove(job)
+                    batch.append(job)
+            remaining = deadline - time.time()
+            if len(batch) >= self.max_batch_size or remaining <= 0:
+                break
+            self._has_pending.wait(remaining)
+        return batch, key
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                batch, key = self._take_batch()
+                self.running += len(batch)
+                if len(batch) > 1:
+                    self.batches += 1
+                    self.batched_jobs += len(batch)
+
+            started_at = time.time()
+            for job in batch:
+                job.state = "running"
+                job.started_at = started_at
+                job.touch()
+            _worker_state.jobs = batch
+            try:
+                if key is not None:
+                    results = self.batch_handler([job.request for job in batch])
+                else:
+                    results = [self.handler(batch[0].request)]
+                for job, result in zip(batch, results):
+                    self._finish_when_ready(job, result)
+            except Exception as e:
+                traceback.print_exc()
+                for job in batch:
+                    self._finish(job, None, str(e))
+            finally:
+                _worker_state.jobs = []
+                with self._lock:
+                    self.running -= len(batch)
+                for job in batch:
+                    if not job.done and not job.deferred:
+                        self._finish(job, None, "No result returned for job")
+
+            suffix = f" (batch of {len(batch)})" if len(batch) > 1 else ""
+            for job in batch:
+                if not job.deferred:
+                    print(f"Job {job.id} {job.state} in {job.finished_at - job.started_at:.1f}s{suffix}")
+
+    def _finish_when_ready(self, job, result):
+        pending = result.pop("pending", None) if isinstance(result, dict) else None
+        if pending is None:
+            self._finish(job, result)
+            return
+
+        def done(future):
+            error = future.exception()
+            self._finish(job, result, f"Writing output failed: {error}" if error is not None else None)
+            print(f"Job {job.id} {job.state} in {job.finished_at - job.started_at:.1f}s (output written)")
+
+        job.deferred = True
+        pending.add_done_callback(done)
+
+    def _finish(self, job, result, error=None):
+        job.result = result
+        if error is not None:
+            job.state = "failed"
+            job.error = error
+        elif isinstance(result, dict) and result.get("status") == "error":
+            job.state = "failed"
+            job.error = result.get("message")
+        else:
+            job.state = "succeeded"
+        job.finished_at = time.time()
+        job.touch()
+        job._done.set()
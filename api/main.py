@@ -1,41 +1,46 @@
 import os
 import sys
-import torch
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request
+from pydantic import BaseModel, PrivateAttr
 from typing import Optional
-import safetensors
-import diffusers
-try:
-    import psutil
-except ImportError:
-    print("WARNING: psutil not available, memory monitoring disabled")
-    psutil = None
-
-# DEBUG LOGGER
-with open("debug_env.txt", "w") as f:
-    f.write(f"Python Executable: {sys.executable}\n")
-    f.write(f"Python Version: {sys.version}\n")
-    f.write(f"Diffusers Version: {diffusers.__version__}\n")
-    f.write(f"Diffusers Path: {diffusers.__file__}\n")
-    from diffusers import StableVideoDiffusionPipeline, DiffusionPipeline
-    f.write(f"SVD has from_single_file: {hasattr(StableVideoDiffusionPipeline, 'from_single_file')}\n")
-    f.write(f"DiffusionPipeline has from_single_file: {hasattr(DiffusionPipeline, 'from_single_file')}\n")
-
-from diffusers import (
-    StableDiffusionPipeline, 
-    StableDiffusionXLPipeline, 
-    StableVideoDiffusionPipeline,
-    FluxPipeline,
-    DPMSolverMultistepScheduler,
-    DiffusionPipeline
-)
 
-from PIL import Image
+# torch, diffusers and the pipeline classes are imported lazily (see load_model)
+# so the app object and GET / come up without waiting for the ML stack.
+
 from fastapi.middleware.cors import CORSMiddleware
-import base64
-from io import BytesIO
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager
 import traceback
+import json
+import asyncio
+import inspect
+import threading
+import time
+
+from memory_utils import get_memory_usage, get_available_memory, check_memory_available, release_pipeline
+from pipeline_cache import PipelineCache, estimate_checkpoint_mb
+from jobs import JobQueue, QueueFullError, current_jobs
+from progress import StepProgress
+from prompt_cache import PromptEmbeddingCache, encoder_family
+from checkpoint_cache import ConvertedCheckpointCache
+from prewarm import ModelPrewarmer, parse_prewarm_targets, parse_resolutions
+from planner import ExecutionPlanner, apply_load_plan, apply_request_plan
+from model_options import parse_model_options, options_for
+from precision import apply_precision, note_request_shape, inference_context
+from quantization import quantize_pipeline, quantized_cache_key
+from engines import ENGINE_NAMES, TorchEngine, OnnxEngine
+from worker_pool import WorkerPool, parse_core_sets
+from weight_store import SharedWeightStore
+from schedulers import select_scheduler, normalize_scheduler_name, default_scheduler
+from previews import LatentPreviewer, TinyVaeCache, TINY_VAE_SOURCES, draft_images
+from interpolation import normalize_interpolation_method, interpolate_latents, interpolate_flow
+from video_writer import VideoStreamWriter
+from video_conditioning import ConditioningCache, plan_svd
+from image_input import data_url_bytes, image_size, fit_within, load_init_image
+from output_writer import OutputWriter, normalize_output_format
+from output_index import OutputIndex, shard_name, is_output_name
+from retention import RetentionManager
 
 class GenerateRequest(BaseModel):
     mode: str = "txt2img"
@@ -49,10 +54,38 @@ class GenerateRequest(BaseModel):
     init_image: Optional[str] = None
     seed: Optional[int] = -1
     strength: Optional[float] = 0.75
+    # "DPM++ 2M", "DPM++ 2M Karras", "Euler a", "UniPC", "DDIM", "LCM"; None keeps the checkpoint's
+    scheduler: Optional[str] = None
+    # "draft" decodes the final image with the tiny VAE (much faster on CPU, softer details)
+    quality: Optional[str] = "full"
+    # "png", "webp", "webp_lossless" or "jpeg"; None uses OUTPUT_FORMAT. Quality applies to webp/jpeg
+    output_format: Optional[str] = None
+    output_quality: Optional[int] = None
+    # Also return the encoded image as a data URL in the result ("data"), without waiting for the file
+    inline: Optional[bool] = False
+    # Raw image bytes from POST /generate/upload and /jobs/upload (instead of the init_image data URL);
+    # private, so only the upload handlers set it and it stays out of the JSON body and the schema
+    _init_image_bytes: Optional[bytes] = PrivateAttr(default=None)
 
 import uuid
 
-app = FastAPI(title="Diffusion Lite API")
+DEFAULT_MODEL = os.environ.get("DEFAULT_MODEL", "v1-5-pruned-emaonly.safetensors")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    os.makedirs(OUTPUT_PATH, exist_ok=True)
+    # Syncs the output index with the disk, then enforces the output quota and max age
+    output_retention.start()
+    # Workers and prewarming start in the background so GET / answers immediately
+    if worker_pool is not None:
+        # Worker processes load and prewarm their own models
+        worker_pool.start()
+    elif PREWARM_ENABLED:
+        model_prewarmer.start()
+    job_queue.start()
+    yield
+
+app = FastAPI(title="Diffusion Lite API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -64,64 +97,225 @@ app.add_middleware(
 
 MODEL_PATH = "../models/checkpoints"
 OUTPUT_PATH = "../web/public/outputs"
-os.makedirs(OUTPUT_PATH, exist_ok=True)
 
-# Global variable to store the active pipeline to avoid reloading
-current_pipe = None
-current_model_name = ""
-current_mode = ""
+# Loaded pipelines, keyed by (checkpoint, task), so switching models doesn't reload from disk
+pipeline_cache = PipelineCache(
+    max_entries=int(os.environ.get("PIPELINE_CACHE_MAX_ENTRIES", "3")),
+    max_rss_mb=float(os.environ.get("PIPELINE_CACHE_MAX_RSS_MB", "0")),
+    min_available_mb=float(os.environ.get("PIPELINE_CACHE_MIN_AVAILABLE_MB", "2048")),
+)
 
-# Memory management for CPU with limited RAM
-import gc
-import psutil
+# Text-encoder outputs for repeated prompts (the frontend presets resend the same long prompts)
+PROMPT_CACHE_ENABLED = os.environ.get("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+prompt_cache = PromptEmbeddingCache(
+    max_bytes=int(float(os.environ.get("PROMPT_CACHE_MAX_MB", "256")) * 1024 * 1024),
+    disk_dir=os.environ.get("PROMPT_CACHE_DIR") or None,
+    disk_max_bytes=int(float(os.environ.get("PROMPT_CACHE_DISK_MAX_MB", "1024")) * 1024 * 1024),
+)
 
-def get_memory_usage():
-    """Get current memory usage in MB"""
-    process = psutil.Process()
-    return process.memory_info().rss / (1024 * 1024)
+# Single-file checkpoints converted once to diffusers format, so cold loads skip the conversion
+converted_checkpoints = ConvertedCheckpointCache(
+    os.environ.get("CONVERTED_CACHE_DIR", "cache/converted"),
+    enabled=os.environ.get("CONVERTED_CACHE_ENABLED", "true").lower() == "true",
+)
 
-def check_memory_available(required_mb=1024):
-    """Check if we have enough memory available"""
-    if psutil is None:
-        return True  # Assume OK if psutil not available
+# Weights served from memory-mapped converted checkpoints, shared by every process loading them
+shared_weights = SharedWeightStore(enabled=os.environ.get("SHARED_WEIGHTS", "true").lower() == "true")
 
-    memory = psutil.virtual_memory()
-    available_mb = memory.available / (1024 * 1024)
-    total_mb = memory.total / (1024 * 1024)
+# Tiny autoencoders for "tiny" previews and draft-quality outputs
+tiny_vaes = TinyVaeCache({family: os.environ.get(f"TINY_VAE_{family.upper()}", source)
+                          for family, source in TINY_VAE_SOURCES.items()})
 
-    print(f"Memory: {available_mb:.0f}MB available / {total_mb:.0f}MB total")
-    return available_mb > required_mb
+# Low-resolution previews of the latents published on the job progress stream (0 disables)
+previewer = LatentPreviewer(
+    every_steps=int(os.environ.get("PREVIEW_EVERY_STEPS", "5")),
+    decoder=os.environ.get("PREVIEW_DECODER", "linear"),
+    tiny_vaes=tiny_vaes,
+    max_side=int(os.environ.get("PREVIEW_MAX_SIDE", "256")),
+)
 
-def force_memory_cleanup():
-    """Force garbage collection and memory cleanup"""
-    if current_pipe is not None:
-        try:
-            # Move to CPU and clear CUDA cache if available
-            current_pipe.to("cpu")
-            if hasattr(current_pipe, "vae"):
-                current_pipe.vae.to("cpu")
-            if hasattr(current_pipe, "unet"):
-                current_pipe.unet.to("cpu")
-        except:
-            pass
-
-    # Force garbage collection
-    gc.collect()
-
-    # Clear any cached tensors
-    if hasattr(torch, 'cuda') and torch.cuda.is_available():
-        torch.cuda.empty_cache()
-    elif hasattr(torch, 'mps') and torch.backends.mps.is_available():
-        torch.mps.empty_cache()
+# Per-model opt-in modes, e.g. "ponyXL.safetensors=bf16+channels_last;*=compile"
+model_options = parse_model_options(os.environ.get("MODEL_OPTIONS", ""))
+
+# Int8 weights of models loaded with the "quantized" option, so later loads skip the quantization pass
+QUANTIZED_CACHE_DIR = os.environ.get("QUANTIZED_CACHE_DIR", "cache/quantized")
+quantization_reports = {}
+
+# Inference engines, chosen per model with the "engine:<name>" model option
+onnx_engine = OnnxEngine(
+    os.environ.get("ONNX_CACHE_DIR", "cache/onnx"),
+    intra_op_threads=int(os.environ.get("ONNX_INTRA_OP_THREADS", "0")),
+    inter_op_threads=int(os.environ.get("ONNX_INTER_OP_THREADS", "1")),
+)
+inference_engines = {"torch": TorchEngine(), "onnx": onnx_engine}
+
+# Picks device, attention, VAE, offload and thread settings from the detected hardware
+execution_planner = ExecutionPlanner(workers=int(os.environ.get("JOB_WORKERS", "1")))
+
+# Img2img model behind the fallback video path; its frames run as batched calls of up to
+# FALLBACK_VIDEO_MAX_BATCH frames, fewer when memory is short
+FALLBACK_VIDEO_MODEL = "v1-5-pruned-emaonly.safetensors"
+FALLBACK_VIDEO_MAX_BATCH = int(os.environ.get("FALLBACK_VIDEO_MAX_BATCH", "4"))
+# Rough per-frame working memory of a batched fallback call besides attention and VAE decode
+FALLBACK_FRAME_MB = 300
+# Diffusion keyframes of a fallback video and the frames synthesized between each pair of them:
+# slerp (interpolated latents, one VAE decode per frame), flow (optical flow on decoded keyframes) or none
+FALLBACK_VIDEO_KEYFRAMES = int(os.environ.get("FALLBACK_VIDEO_KEYFRAMES", "4"))
+FALLBACK_VIDEO_INTERPOLATION = normalize_interpolation_method(os.environ.get("FALLBACK_VIDEO_INTERPOLATION", "flow"))
+FALLBACK_VIDEO_INBETWEENS = int(os.environ.get("FALLBACK_VIDEO_INBETWEENS", "3"))
+FALLBACK_VIDEO_FPS = int(os.environ.get("FALLBACK_VIDEO_FPS", "12"))
+
+# SVD image-encoder embeddings and VAE conditioning latents per init image, so re-rolls skip both encoders
+svd_conditioning = ConditioningCache(max_entries=int(os.environ.get("SVD_CONDITIONING_CACHE_ENTRIES", "8")))
+
+# Image outputs are encoded and written on a background I/O thread
+output_writer = OutputWriter(
+    default_format=os.environ.get("OUTPUT_FORMAT", "png"),
+    png_compress_level=int(os.environ.get("OUTPUT_PNG_COMPRESS_LEVEL", "1")),
+    webp_quality=int(os.environ.get("OUTPUT_WEBP_QUALITY", "90")),
+    webp_method=int(os.environ.get("OUTPUT_WEBP_METHOD", "4")),
+    jpeg_quality=int(os.environ.get("OUTPUT_JPEG_QUALITY", "92")),
+)
 
+# SQLite index of outputs (params, seed, timings, size) with WebP thumbnails in OUTPUT_PATH/thumbs
+output_index = OutputIndex(
+    os.environ.get("OUTPUT_INDEX_PATH", "cache/outputs.sqlite3"),
+    OUTPUT_PATH,
+    thumbnail_size=int(os.environ.get("OUTPUT_THUMBNAIL_SIZE", "256")),
+)
+
+# Evicts least recently accessed outputs above OUTPUT_QUOTA_MB and outputs older than OUTPUT_MAX_AGE_DAYS
+# (both off by default: 0 disables either); pinned outputs are kept
+output_retention = RetentionManager(
+    output_index,
+    OUTPUT_PATH,
+    quota_bytes=int(float(os.environ.get("OUTPUT_QUOTA_MB", "0")) * 1024 * 1024),
+    max_age_seconds=float(os.environ.get("OUTPUT_MAX_AGE_DAYS", "0")) * 86400,
+    interval=float(os.environ.get("OUTPUT_RETENTION_INTERVAL", "60")),
+    batch=int(os.environ.get("OUTPUT_RETENTION_BATCH", "200")),
+)
+
+# MP4 encoding of generated videos, done on a background thread while frames are still being produced
+VIDEO_CODEC = os.environ.get("VIDEO_CODEC", "libx264")
+VIDEO_CRF = int(os.environ.get("VIDEO_CRF", "23"))
+VIDEO_PRESET = os.environ.get("VIDEO_PRESET", "veryfast")
+VIDEO_ENCODER_QUEUE = int(os.environ.get("VIDEO_ENCODER_QUEUE", "8"))
+
+# Held while a checkpoint is read from disk
+model_load_lock = threading.Lock()
+
+debug_env_written = False
+
+def write_debug_env():
+    """DEBUG LOGGER: record the interpreter and diffusers install on first model load"""
+    global debug_env_written
+    if debug_env_written:
+        return
+    debug_env_written = True
+
+    import diffusers
+    from diffusers import StableVideoDiffusionPipeline, DiffusionPipeline
+    with open("debug_env.txt", "w") as f:
+        f.write(f"Python Executable: {sys.executable}\n")
+        f.write(f"Python Version: {sys.version}\n")
+        f.write(f"Diffusers Version: {diffusers.__version__}\n")
+        f.write(f"Diffusers Path: {diffusers.__file__}\n")
+        f.write(f"SVD has from_single_file: {hasattr(StableVideoDiffusionPipeline, 'from_single_file')}\n")
+        f.write(f"DiffusionPipeline has from_single_file: {hasattr(DiffusionPipeline, 'from_single_file')}\n")
+
+def force_memory_cleanup():
+    """Drop every cached pipeline and force garbage collection"""
+    pipeline_cache.clear()
+    release_pipeline(None)
     print(f"Memory cleanup completed. Current usage: {get_memory_usage():.1f} MB")
 
 @app.get("/")
 async def root():
-    return {"status": "online", "message": "Diffusion Lite API is running"}
+    readiness = default_model_readiness()
+    return {
+        "status": "online",
+        "message": "Diffusion Lite API is running",
+        # The proxy can hold traffic until the default model is loaded and warmed up; a "failed" or
+        # "unavailable" readiness state is final, so it shouldn't wait for that one
+        "ready": readiness["state"] == "ready",
+        "readiness": readiness,
+        "default_model": DEFAULT_MODEL,
+        "models": model_prewarmer.readiness() if worker_pool is None else worker_pool.loaded_models(),
+    }
+
+def default_model_readiness():
+    """Prewarm state of DEFAULT_MODEL (txt2img); "ready" when it isn't prewarmed at all"""
+    if not PREWARM_ENABLED:
+        return {"state": "ready", "prewarm": False}
+    source = worker_pool if worker_pool is not None else model_prewarmer
+    state = source.target_state(DEFAULT_MODEL)
+    if state is None:
+        # Not a PREWARM_MODELS target: nothing to wait for, it loads on first use
+        return {"state": "ready", "prewarm": False}
+    return dict(state, prewarm=True)
+
+@app.get("/cache/pipelines")
+async def pipeline_cache_stats():
+    return pipeline_cache.stats()
+
+@app.get("/plan")
+async def execution_plan(model_name: Optional[str] = None, width: int = 512, height: int = 512, batch_size: int = 1):
+    """Hardware summary and the execution plan chosen for a model at a resolution"""
+    model_mb = estimate_checkpoint_mb(os.path.join(MODEL_PATH, model_name)) if model_name else 0.0
+    plan = await run_in_threadpool(execution_planner.plan, model_mb, width, height, batch_size)
+    return {"hardware": execution_planner.hardware, "plan": plan}
+
+@app.get("/cache/checkpoints")
+async def checkpoint_cache_stats():
+    return converted_checkpoints.stats()
+
+@app.get("/cache/weights")
+async def shared_weight_stats():
+    return shared_weights.stats()
+
+@app.get("/cache/quantized")
+async def quantized_cache_stats():
+    return {"cache_dir": QUANTIZED_CACHE_DIR, "models": quantization_reports}
+
+@app.get("/engines")
+async def engine_stats():
+    return {"available": list(ENGINE_NAMES), "onnx": onnx_engine.stats()}
+
+@app.get("/cache/prompts")
+async def prompt_cache_stats():
+    return prompt_cache.stats()
+
+@app.get("/cache/conditioning")
+async def conditioning_cache_stats():
+    return svd_conditioning.stats()
+
+def get_prompt_kwargs(pipe, model_name, prompts, negative_prompts):
+    """Prompt arguments for a pipeline call, served from the embedding cache when possible"""
+    if PROMPT_CACHE_ENABLED:
+        try:
+            # Size and mtime in the key so a replaced checkpoint never reuses stale embeddings
+            stat = os.stat(os.path.join(MODEL_PATH, model_name))
+            model_key = f"{model_name}:{stat.st_size}:{int(stat.st_mtime)}"
+            if getattr(pipe, "_quantization", None):
+                # int8 text encoders give slightly different embeddings than the fp32 ones
+                model_key += ":int8"
+            return prompt_cache.pipeline_kwargs(pipe, model_key, prompts, negative_prompts)
+        except Exception as e:
+            print(f"Prompt cache unavailable, encoding prompts in the pipeline: {e}")
+    if len(prompts) == 1:
+        return {"prompt": prompts[0], "negative_prompt": negative_prompts[0]}
+    return {"prompt": list(prompts), "negative_prompt": list(negative_prompts)}
+
+def fallback_video_fps():
+    """Frame rate of fallback videos; keyframes keep the same spacing in time with or without in-betweens"""
+    inbetweens = FALLBACK_VIDEO_INBETWEENS if FALLBACK_VIDEO_INTERPOLATION != "none" else 0
+    return max(1, round(FALLBACK_VIDEO_FPS * (inbetweens + 1) / (FALLBACK_VIDEO_INBETWEENS + 1)))
+
+def generate_fallback_video(init_img, req, generator, writer):
+    """Generate a simple video from img2img keyframes with synthesized frames in between.
 
-def generate_fallback_video(init_img, req, generator):
-    """Generate a simple video by creating multiple img2img frames with variations"""
+    Frames go to `writer` as soon as they are decoded; returns how many were written.
+    """
     print("Generating fallback video using img2img frames...")
 
     # Check memory before loading fallback model
@@ -129,82 +323,240 @@ def generate_fallback_video(init_img, req, generator):
     if not check_memory_available(3000):  # Need at least 3GB free for safety
         print("ERROR: Not enough memory for video generation (need 3GB free)")
         print("Try closing other applications or use image generation instead")
-        return []
+        return 0
 
     # Load a lightweight model for img2img (we'll use SD 1.5 since it's lighter)
-    fallback_model = load_model("v1-5-pruned-emaonly.safetensors", "img2img")
+    fallback_model = load_model(FALLBACK_VIDEO_MODEL, "img2img")
     if fallback_model is None:
         print("ERROR: Could not load fallback model")
-        return []
-    if fallback_model is None:
-        raise HTTPException(status_code=500, detail="No suitable model available for video generation")
+        return 0
 
-    frames = []
-    # Ultra-reduced frames for memory efficiency
-    num_frames = 4  # Only 4 frames for very low memory usage
+    # Only a few diffusion keyframes; the frames between them are synthesized
+    num_frames = FALLBACK_VIDEO_KEYFRAMES
+    inbetweens = FALLBACK_VIDEO_INBETWEENS if FALLBACK_VIDEO_INTERPOLATION != "none" else 0
 
     print(f"Memory after model load: {get_memory_usage():.1f} MB")
 
     # Create variations by slightly changing the seed and prompt
     base_seed = 42  # Use fixed seed for consistency
 
-    for i in range(num_frames):
-        print(f"Generating frame {i+1}/{num_frames}... (Memory: {get_memory_usage():.1f} MB)")
+    written = 0
+    with fallback_model._generation_lock, inference_context(fallback_model):
+        select_scheduler(fallback_model, req.scheduler)
+        keyframes = _generate_fallback_frames(fallback_model, init_img, req, num_frames, base_seed)
+        if not keyframes:
+            return 0
+
+        started = time.time()
+        draft = use_draft_decoder(fallback_model, req.quality)
+        width, height = init_img.size
+        if FALLBACK_VIDEO_INTERPOLATION == "slerp":
+            frames = _decode_fallback_latents(fallback_model, interpolate_latents(keyframes, inbetweens),
+                                              draft, width, height)
+        else:
+            frames = _decode_fallback_latents(fallback_model, keyframes, draft, width, height)
+            if FALLBACK_VIDEO_INTERPOLATION == "flow":
+                frames = interpolate_flow(list(frames), inbetweens)
+        for frame in frames:
+            writer.add(frame)
+            written += 1
+        print(f"Decoded and synthesized {written} frames from {len(keyframes)} keyframes "
+              f"({FALLBACK_VIDEO_INTERPOLATION}) in {time.time() - started:.1f}s")
+
+    print(f"Generated {written} frames for fallback video. Final memory: {get_memory_usage():.1f} MB")
+    return written
+
+def fallback_batch_size(num_frames, width, height):
+    """Frames per batched img2img call that fit in the memory available right now"""
+    available_mb = get_available_memory()
+    if available_mb is None:
+        return min(num_frames, FALLBACK_VIDEO_MAX_BATCH)
+    for batch_size in range(min(num_frames, FALLBACK_VIDEO_MAX_BATCH), 1, -1):
+        plan = execution_planner.plan(0, width, height, batch_size)
+        needed_mb = FALLBACK_FRAME_MB * batch_size + plan["estimated_attention_mb"] + plan["estimated_vae_decode_mb"]
+        if needed_mb < available_mb * 0.5:
+            return batch_size
+    return 1
+
+def _generate_fallback_frames(fallback_model, init_img, req, num_frames, base_seed):
+    import torch
+
+    if init_img is None:
+        print("ERROR: Fallback video needs an init image")
+        return []
 
-        # Check memory before each frame
-        if not check_memory_available(800):  # Need at least 800MB free per frame
-            print("WARNING: Low memory during frame generation, stopping to prevent crash")
-            break
+    # Encode the init image once; every frame starts from the same latents
+    width, height = init_img.size
+    image = fallback_model.image_processor.preprocess(init_img, height=height, width=width)
+    vae = fallback_model.vae
+    image = image.to(device=vae.device, dtype=vae.dtype)
+    encode_generator = torch.Generator(device="cpu").manual_seed(base_seed)
+    init_latents = vae.encode(image).latent_dist.sample(encode_generator) * vae.config.scaling_factor
 
-        # Vary the seed slightly for each frame
-        frame_seed = base_seed + i * 100
-        frame_generator = torch.Generator(device="cpu").manual_seed(frame_seed)
+    # Simple motion variation, one prompt and seed per frame
+    motion_words = ["moving", "dynamic", "flowing", "animated"]
+    prompts = [f"{req.prompt}, {motion_words[i % len(motion_words)]}" for i in range(num_frames)]
+    seeds = [base_seed + i * 100 for i in range(num_frames)]
+    strength = 0.6  # Fixed strength for consistency
 
-        # Simple motion variation (reduced complexity)
-        motion_words = ["moving", "dynamic", "flowing", "animated"]
-        frame_prompt = f"{req.prompt}, {motion_words[i % len(motion_words)]}"
+    frames = []
+    batch_size = fallback_batch_size(num_frames, width, height)
+    for first in range(0, num_frames, batch_size):
+        count = min(batch_size, num_frames - first)
+        print(f"Generating frames {first + 1}-{first + count}/{num_frames}... (Memory: {get_memory_usage():.1f} MB)")
 
-        # Generate frame with minimal settings for memory
-        strength = 0.6  # Fixed strength for consistency
+        if not check_memory_available(800 * count):  # Need at least 800MB free per frame
+            print("WARNING: Low memory during frame generation, stopping to prevent crash")
+            break
 
-        frame = fallback_model(
-            prompt=frame_prompt,
-            negative_prompt=req.negative_prompt or "",
-            image=init_img,
+        plan_for_request(fallback_model, width, height, count)
+        frame_progress = StepProgress(current_jobs(), int(6 * strength),
+                                      stage=f"frames {first + 1}-{first + count}/{num_frames}")
+        # 4-channel images are taken as latents by the img2img pipeline: no VAE encode per frame
+        frames.extend(fallback_model(
+            **get_prompt_kwargs(fallback_model, FALLBACK_VIDEO_MODEL, prompts[first:first + count],
+                                [req.negative_prompt or ""] * count),
+            image=init_latents.repeat(count, 1, 1, 1),
+            output_type="latent",
             num_inference_steps=6,  # Very low steps for speed/memory
             guidance_scale=min(5.0, req.cfg),  # Reduced guidance for memory
             strength=strength,
-            generator=frame_generator,
-            width=256,  # Even smaller resolution
-            height=256
-        ).images[0]
-
-        frames.append(frame)
+            generator=[torch.Generator(device="cpu").manual_seed(seed) for seed in seeds[first:first + count]],
+            **frame_progress.pipeline_kwargs(fallback_model)
+        ).images)
 
-        # Force cleanup after each frame
-        if i < num_frames - 1:  # Don't cleanup on last frame
-            gc.collect()
-
-    print(f"Generated {len(frames)} frames. Final memory: {get_memory_usage():.1f} MB")
-
-    print(f"Generated {len(frames)} frames for fallback video")
     return frames
 
-def load_model(model_name: str, mode: str = "txt2img"):
-    global current_pipe, current_model_name, current_mode
-    
-    # We need to reload if model OR mode (task) changed
+def _decode_fallback_latents(fallback_model, latents, draft, width, height):
+    """Decode per-frame latents to images in memory-sized chunks (tiny VAE for drafts), yielding each image"""
+    import torch
+
+    vae = fallback_model.vae
+    chunk_size = fallback_batch_size(len(latents), width, height)
+    for first in range(0, len(latents), chunk_size):
+        chunk = torch.stack(latents[first:first + chunk_size])
+        if draft:
+            yield from draft_images(fallback_model, chunk, tiny_vaes, width, height)
+        else:
+            decoded = vae.decode(chunk.to(vae.dtype) / vae.config.scaling_factor, return_dict=False)[0]
+            yield from fallback_model.image_processor.postprocess(decoded, output_type="pil")
+
+def stream_video_latents(pipe, latents, decode_chunk_size, writer):
+    """Decode video latents (batch, frames, channels, h, w) chunk by chunk straight into the writer"""
+    latents = latents.flatten(0, 1) / pipe.vae.config.scaling_factor
+    # Same num_frames handling as the pipeline's own decode_latents (temporal VAE decoders take it)
+    accepts_num_frames = "num_frames" in inspect.signature(pipe.vae.forward).parameters
+    processor = getattr(pipe, "video_processor", None) or pipe.image_processor
+    for first in range(0, latents.shape[0], decode_chunk_size):
+        chunk = latents[first:first + decode_chunk_size]
+        decode_kwargs = {"num_frames": chunk.shape[0]} if accepts_num_frames else {}
+        decoded = pipe.vae.decode(chunk.to(pipe.vae.dtype), **decode_kwargs).sample
+        for frame in processor.postprocess(decoded.float(), output_type="pil"):
+            writer.add(frame)
+    return latents.shape[0]
+
+def open_video_writer(filename, fps, size=None):
+    """Streaming MP4 writer for an output file, with the VIDEO_* encoder settings"""
+    return VideoStreamWriter(os.path.join(OUTPUT_PATH, filename), fps, codec=VIDEO_CODEC, crf=VIDEO_CRF,
+                             preset=VIDEO_PRESET, size=size, max_pending=VIDEO_ENCODER_QUEUE)
+
+def get_task(mode: str):
     # Correct task detection: check for video first
     if "vid" in mode:
-        task = "img2vid"
+        return "img2vid"
     elif "img2img" in mode:
-        task = "img2img"
-    else:
-        task = "txt2img"
+        return "img2img"
+    return "txt2img"
+
+# Tasks whose pipelines can be built from the same loaded components
+SHARED_WEIGHT_TASKS = ("txt2img", "img2img")
+
+def native_resolution(model_name: str):
+    """Resolution a checkpoint family is usually run at (used for the load-time plan)"""
+    name = model_name.lower()
+    if "svd" in name:
+        return 1024, 576
+    if "flux" in name or "xl" in name or "pony" in name or "hentaimix" in name:
+        return 1024, 1024
+    return 512, 512
+
+def plan_for_request(pipe, width, height, batch_size=1):
+    """Re-plan attention/VAE settings for this request's resolution and batch size"""
+    load_plan = getattr(pipe, "_load_plan", None)
+    if load_plan is None:
+        return
+    unet = getattr(pipe, "unet", None)
+    apply_request_plan(pipe, execution_planner.plan(load_plan["model_mb"], width, height, batch_size,
+                                                    unet_config=getattr(unet, "config", None)))
+    note_request_shape(pipe, width, height, batch_size)
+
+def get_pipeline_class(model_name: str, task: str):
+    """Pick the diffusers pipeline class for an image checkpoint family and task"""
+    # Only the requested family is imported; diffusers loads its submodules lazily
+    name = model_name.lower()
+    if "flux" in name:
+        from diffusers import FluxPipeline, FluxImg2ImgPipeline
+        return FluxImg2ImgPipeline if task == "img2img" else FluxPipeline
+    if "xl" in name or "pony" in name or "hentaimix" in name:
+        from diffusers import StableDiffusionXLPipeline, StableDiffusionXLImg2ImgPipeline
+        return StableDiffusionXLImg2ImgPipeline if task == "img2img" else StableDiffusionXLPipeline
+    from diffusers import StableDiffusionPipeline, StableDiffusionImg2ImgPipeline
+    return StableDiffusionImg2ImgPipeline if task == "img2img" else StableDiffusionPipeline
+
+def derive_task_pipeline(source_pipe, cls):
+    """Build a pipeline of another task class on top of source_pipe's modules.
+
+    UNet/transformer, VAE, text encoders and tokenizers are passed by reference,
+    so no weights are copied. Schedulers keep per-call timestep state, so the
+    new pipeline gets its own instance built from the same config.
+    """
+    components = dict(source_pipe.components)
+    if components.get("scheduler") is not None:
+        # Start from the loaded scheduler, not one a request swapped in
+        scheduler = default_scheduler(source_pipe)
+        components["scheduler"] = scheduler.__class__.from_config(scheduler.config)
+
+    accepted = inspect.signature(cls.__init__).parameters
+    return cls(**{name: module for name, module in components.items() if name in accepted})
 
-    if current_model_name == model_name and current_pipe is not None and current_mode == mode:
-        print(f"Using cached pipeline for {model_name} in {mode} mode")
-        return current_pipe
+def load_model(model_name: str, mode: str = "txt2img"):
+    task = get_task(mode)
+
+    cached_pipe = pipeline_cache.get((model_name, task))
+    if cached_pipe is None:
+        # Serialize loads so concurrent jobs never read the same checkpoint twice
+        with model_load_lock:
+            cached_pipe = pipeline_cache.peek((model_name, task))
+            if cached_pipe is None:
+                return _load_model(model_name, task)
+
+    print(f"Using cached pipeline for {model_name} in {task} mode")
+    return cached_pipe
+
+def _load_model(model_name: str, task: str):
+    import torch
+
+    # A txt2img <-> img2img switch reuses the already loaded weights of the other task
+    if task in SHARED_WEIGHT_TASKS and "svd" not in model_name.lower():
+        for other_task in SHARED_WEIGHT_TASKS:
+            source_pipe = pipeline_cache.peek((model_name, other_task)) if other_task != task else None
+            if source_pipe is None:
+                continue
+            pipe = derive_task_pipeline(source_pipe, get_pipeline_class(model_name, task))
+            pipe._task = task
+            # Same modules, same lock: a txt2img and an img2img job must not run on shared weights at once
+            pipe._generation_lock = source_pipe._generation_lock
+            pipe._load_plan = getattr(source_pipe, "_load_plan", None)
+            pipe._precision = getattr(source_pipe, "_precision", [])
+            pipe._quantization = getattr(source_pipe, "_quantization", None)
+            pipe._engine = getattr(source_pipe, "_engine", "torch")
+            if hasattr(source_pipe, "_compiled_shapes"):
+                pipe._compiled_shapes = source_pipe._compiled_shapes
+            shared = [name for name, module in pipe.components.items()
+                      if module is not None and module is source_pipe.components.get(name)]
+            print(f"Built {task} pipeline for {model_name} from cached {other_task} weights (shared: {', '.join(shared)})")
+            pipeline_cache.put((model_name, task), pipe, 0.0)
+            return pipe
 
     print(f"Loading model: {model_name} for {task}...")
     checkpoint_path = os.path.join(MODEL_PATH, model_name)
@@ -213,12 +565,11 @@ def load_model(model_name: str, mode: str = "txt2img"):
         print(f"Warning: {checkpoint_path} not found. Using placeholder logic.")
         return None
 
-    device = "cpu"
-    from diffusers import (
-        StableDiffusionImg2ImgPipeline,
-        StableDiffusionXLImg2ImgPipeline,
-        FluxImg2ImgPipeline
-    )
+    # Evict least-recently-used pipelines until the new one fits the memory budget
+    pipeline_cache.make_room(estimate_checkpoint_mb(checkpoint_path))
+    rss_before_load = get_memory_usage()
+
+    write_debug_env()
 
     # MANUAL MIXIN PATCH
     try:
@@ -231,12 +582,14 @@ def load_model(model_name: str, mode: str = "txt2img"):
              FromSingleFileMixin = object # Mock if completely missing (will fail later but avoids import error)
 
     if "flux" in model_name.lower():
-        cls = FluxImg2ImgPipeline if task == "img2img" else FluxPipeline
-        pipe = cls.from_single_file(checkpoint_path, torch_dtype=torch.float32)
+        cls = get_pipeline_class(model_name, task)
+        pipe = converted_checkpoints.load(cls, checkpoint_path, torch_dtype=torch.float32)
     elif "xl" in model_name.lower() or "pony" in model_name.lower() or "hentaimix" in model_name.lower():
-        cls = StableDiffusionXLImg2ImgPipeline if task == "img2img" else StableDiffusionXLPipeline
-        pipe = cls.from_single_file(checkpoint_path, torch_dtype=torch.float32)
+        cls = get_pipeline_class(model_name, task)
+        pipe = converted_checkpoints.load(cls, checkpoint_path, torch_dtype=torch.float32)
     elif "svd" in model_name.lower():
+        from diffusers import StableVideoDiffusionPipeline
+
         # Force Mixin if method is missing
         if not hasattr(StableVideoDiffusionPipeline, 'from_single_file'):
             print("PATCH: Applying FromSingleFileMixin manually to SVD...")
@@ -329,8 +682,8 @@ def load_model(model_name: str, mode: str = "txt2img"):
             # Don't cache None values
             return None
     else:
-        cls = StableDiffusionImg2ImgPipeline if task == "img2img" else StableDiffusionPipeline
-        pipe = cls.from_single_file(checkpoint_path, torch_dtype=torch.float32, local_files_only=True)
+        cls = get_pipeline_class(model_name, task)
+        pipe = converted_checkpoints.load(cls, checkpoint_path, torch_dtype=torch.float32, local_files_only=True)
         
         # REGRESSION FIX: Diffusers 0.36.0 sometimes loads SD1.5 UNets with 'addition_embed_type="text_time"'
         # This causes the UNet to expect 'added_cond_kwargs' (SDXL feature) which this pipeline doesn't provide.
@@ -341,46 +694,67 @@ def load_model(model_name: str, mode: str = "txt2img"):
 
     if pipe is not None:  # Only set attributes if pipe is loaded
         pipe._task = task # Custom attribute to track
-        pipe.to(device)
-
-        # CPU optimizations for Ryzen 5 5600G
-        if hasattr(pipe, "enable_attention_slicing"):
-            pipe.enable_attention_slicing("max")  # Maximize CPU efficiency
-        if hasattr(pipe, "enable_vae_slicing"):
-            pipe.enable_vae_slicing()
-
-        # Additional CPU optimizations
-        if hasattr(pipe, "enable_vae_tiling"):
-            pipe.enable_vae_tiling()  # Reduce VAE memory usage
-
-        # For CPU, use float32 but with memory optimizations
-        if device == "cpu":
-            # Enable model CPU offload if available (moves parts of model to CPU dynamically)
-            if hasattr(pipe, "enable_model_cpu_offload"):
-                try:
-                    pipe.enable_model_cpu_offload()
-                    print("Enabled model CPU offload for memory efficiency")
-                except Exception as e:
-                    print(f"CPU offload not available: {e}")
-
-            # Enable sequential CPU offload as fallback
-            elif hasattr(pipe, "enable_sequential_cpu_offload"):
-                try:
-                    pipe.enable_sequential_cpu_offload()
-                    print("Enabled sequential CPU offload")
-                except Exception as e:
-                    print(f"Sequential CPU offload failed: {e}")
+        # Pipelines keep scheduler state during a call, so one generation at a time per pipeline
+        pipe._generation_lock = threading.Lock()
+        if shared_weights.enabled and converted_checkpoints.enabled and "svd" not in model_name.lower():
+            report = shared_weights.attach(pipe, converted_checkpoints.converted_dir(checkpoint_path))
+            print(f"Shared weights for {model_name}: {report['shared_mb']:.0f} MB mapped "
+                  f"({', '.join(report['components'])}), {report['private_mb']:.0f} MB private")
+        # Device, offload, threads, attention and VAE settings come from the hardware planner
+        plan = execution_planner.plan(estimate_checkpoint_mb(checkpoint_path), *native_resolution(model_name))
+        apply_load_plan(pipe, plan)
+        apply_request_plan(pipe, plan)
+        print(f"Execution plan for {model_name}: {'; '.join(plan['reasons'])}")
+
+        options = options_for(model_options, model_name)
+        engine = inference_engines.get(options.get("engine") or "torch")
+        if engine is None:
+            print(f"WARNING: unknown engine {options.get('engine')!r} for {model_name}, using torch")
+            engine = inference_engines["torch"]
+        if engine.name == "onnx":
+            if plan["device"] != "cpu":
+                print(f"WARNING: onnx engine ignored for {model_name}, pipeline runs on {plan['device']}")
+                engine = inference_engines["torch"]
+            else:
+                # The ONNX export is float32 and replaces the torch forward passes these modes act on
+                dropped = [name for name in ("quantized", "bf16", "bf16_autocast", "compile") if options.get(name)]
+                if dropped:
+                    print(f"WARNING: {', '.join(dropped)} ignored for {model_name} with the onnx engine")
+                    options = dict(options, **{name: False for name in dropped})
+
+        if options.get("quantized"):
+            if plan["device"] != "cpu":
+                # Dynamic int8 kernels are CPU-only
+                print(f"WARNING: quantized ignored for {model_name}, pipeline runs on {plan['device']}")
+            else:
+                if options.get("bf16"):
+                    print(f"WARNING: bf16 ignored for {model_name}, int8 quantization needs float32 weights")
+                    options = dict(options, bf16=False)
+                report = quantize_pipeline(pipe, QUANTIZED_CACHE_DIR, quantized_cache_key(checkpoint_path))
+                quantization_reports[model_name] = report
+                saved = sum(item["saved_mb"] for item in report.values())
+                print(f"Quantized {model_name} to int8 ({', '.join(report)}), ~{saved:.0f} MB of weights saved")
+
+        # Opt-in bf16 / channels_last / torch.compile modes from MODEL_OPTIONS
+        precision = apply_precision(pipe, options, execution_planner.hardware)
+        if precision:
+            print(f"Precision modes for {model_name}: {', '.join(precision)}")
+
+        engine_report = engine.prepare(pipe, checkpoint_path)
+        if engine_report:
+            print(f"Engine {engine.name} for {model_name}: {engine_report}")
 
         # Only update cache if we successfully loaded a pipeline
-        current_pipe = pipe
-        current_model_name = model_name
-        current_mode = mode
+        loaded_mb = max(get_memory_usage() - rss_before_load, 0.0)
+        pipeline_cache.put((model_name, task), pipe, loaded_mb)
+        print(f"Cached pipeline {model_name} ({task}), ~{loaded_mb:.0f} MB")
 
     return pipe
 
-@app.post("/generate")
-@app.post("/generate")
-async def generate(req: GenerateRequest):
+def run_generation(req: GenerateRequest):
+    """Run one generation request synchronously (called from job worker threads)"""
+    import torch
+
     try:
         pipe = load_model(req.model_name, req.mode)
         
@@ -390,32 +764,31 @@ async def generate(req: GenerateRequest):
                 # Try fallback video generation
                 try:
                     print("Attempting fallback video generation...")
-                    init_img = None
-                    if req.init_image:
-                        header, encoded = req.init_image.split(",", 1)
-                        init_img = Image.open(BytesIO(base64.b64decode(encoded))).convert("RGB")
-                        # Resize for CPU efficiency
-                        init_img = init_img.resize((384, 384), resample=Image.LANCZOS)
-
-                    fallback_frames = generate_fallback_video(init_img, req, torch.Generator(device="cpu").manual_seed(42))
-
-                    if not fallback_frames:
+                    # Small init image for CPU efficiency
+                    init_img = request_init_image(req, lambda size: (384, 384))
+
+                    filename = new_output_filename(".mp4")
+                    # Frames are encoded while the next ones are generated, shrunk to 160x160 on the way
+                    started = time.time()
+                    writer = open_video_writer(filename, fallback_video_fps(), size=(160, 160))
+                    try:
+                        written = generate_fallback_video(init_img, req, torch.Generator(device="cpu").manual_seed(42),
+                                                          writer)
+                    except Exception:
+                        writer.abort()
+                        raise
+                    if not written:
+                        writer.abort()
                         print("No frames generated, using placeholder")
                         return {"status": "success", "url": "outputs/placeholder.png", "type": "image"}
-
-                    filename = f"{uuid.uuid4()}.mp4"
-                    from diffusers.utils import export_to_video
-
-                    # Resize frames to very small size for video export (memory efficient)
-                    print(f"Resizing {len(fallback_frames)} frames for video export...")
-                    resized_frames = []
-                    for frame in fallback_frames:
-                        resized_frame = frame.resize((160, 160), Image.LANCZOS)
-                        resized_frames.append(resized_frame)
-
-                    print(f"Exporting video with {len(resized_frames)} frames...")
-                    export_to_video(resized_frames, os.path.join(OUTPUT_PATH, filename), fps=2)  # Very slow FPS
-                    return {"status": "success", "url": f"outputs/{filename}", "type": "video", "seed": 42}
+                    generation_seconds = time.time() - started
+                    video = writer.close()
+                    video["generation_seconds"] = round(generation_seconds, 2)
+                    print(f"Encoded {video['frames']} frames: {video['encode_seconds']}s encoding alongside "
+                          f"{video['generation_seconds']}s of generation, {video['flush_seconds']}s after it")
+                    index_output(filename, "video", "mp4", 42, req, video_timings(video), writer.first_frame)
+                    return {"status": "success", "url": f"outputs/{filename}", "type": "video", "seed": 42,
+                            "video": video}
                 except Exception as fallback_error:
                     print(f"Fallback video generation failed: {fallback_error}")
                     import traceback
@@ -425,95 +798,458 @@ async def generate(req: GenerateRequest):
                 return {"status": "success", "url": "outputs/placeholder.png", "type": "image"}
 
         # Handle image inputs for I2I or Img2Vid
-        init_img = None
-        if req.init_image:
-            header, encoded = req.init_image.split(",", 1)
-            init_img = Image.open(BytesIO(base64.b64decode(encoded))).convert("RGB")
-            
-            # RESIZE LOGIC
-            # SVD needs specific dimensions (usually 1024x576), so we force it for video
-            if "vid" in req.mode:
-                # Force 1024x576 for SVD stability
-                init_img = init_img.resize((1024, 576), resample=Image.LANCZOS)
-            else:
-                # For Image models, just cap max size to prevent OOM
-                max_dim = 768
-                w, h = init_img.size
-                if w > max_dim or h > max_dim:
-                    ratio = min(max_dim / w, max_dim / h)
-                    w = int(w * ratio)
-                    h = int(h * ratio)
-                
-                # Ensure multiple of 8
-                w, h = map(lambda x: x - x % 8, (w, h))
-                init_img = init_img.resize((w, h), resample=Image.LANCZOS)
+        if "vid" in req.mode:
+            video_plan = None
+
+            def svd_size(size):
+                # SVD resolution, frame count and decode chunk size follow the memory available right now
+                nonlocal video_plan
+                video_plan = plan_svd(size, getattr(pipe.unet.config, "num_frames", None))
+                print(f"SVD plan: {video_plan}")
+                return video_plan["width"], video_plan["height"]
+
+            init_img = request_init_image(req, svd_size)
+        else:
+            # For Image models, just cap max size (multiple of 8) to prevent OOM
+            init_img = request_init_image(req, lambda size: fit_within(size, 768))
 
-        filename = f"{uuid.uuid4()}"
+        filename = None
         gen_type = "image"
         
-        seed_used = req.seed if (req.seed is not None and req.seed != -1) else int(torch.randint(0, 2**32 - 1, (1,)).item())
+        seed_used = resolve_seed(req.seed)
         generator = torch.Generator(device="cpu").manual_seed(seed_used)
 
-        with torch.no_grad():
+        if init_img is not None:
+            plan_width, plan_height = init_img.size
+        else:
+            plan_width, plan_height = req.width, req.height
+
+        # img2img skips the first (1 - strength) of the schedule
+        expected_steps = req.steps * req.strength if req.mode == "img2img" else req.steps
+        step_progress = StepProgress(current_jobs(), expected_steps, previewer=previewer,
+                                     size=(plan_width, plan_height))
+        draft = "vid" not in req.mode and use_draft_decoder(pipe, req.quality)
+
+        scheduler_used = None
+        video = None
+        output_image = None
+        with pipe._generation_lock, inference_context(pipe):
+            started = time.time()
+            plan_for_request(pipe, plan_width, plan_height)
+            if "vid" not in req.mode:
+                scheduler_used = select_scheduler(pipe, req.scheduler)
             if req.mode == "img2img":
-                result = pipe(
-                    prompt=req.prompt,
-                    negative_prompt=req.negative_prompt,
+                images = pipe(
+                    **get_prompt_kwargs(pipe, req.model_name, [req.prompt], [req.negative_prompt]),
                     image=init_img,
                     num_inference_steps=req.steps,
                     guidance_scale=req.cfg,
                     strength=req.strength,
-                    generator=generator
-                ).images[0]
-                filename += ".png"
-                result.save(os.path.join(OUTPUT_PATH, filename))
+                    generator=generator,
+                    output_type="latent" if draft else "pil",
+                    **step_progress.pipeline_kwargs(pipe)
+                ).images
+                output_image = draft_images(pipe, images, tiny_vaes, plan_width, plan_height)[0] if draft else images[0]
                 
             elif "vid" in req.mode:
                 gen_type = "video"
 
-                if pipe is None:
-                    # Fallback: Generate video by creating multiple frames with img2img
-                    print("Using fallback video generation (img2img frames)...")
-                    frames = generate_fallback_video(init_img, req, generator)
-                    filename += ".mp4"
-                    from diffusers.utils import export_to_video
-                    export_to_video(frames, os.path.join(OUTPUT_PATH, filename), fps=4)  # Slower fps for CPU
-                else:
-                    # Use actual SVD
-                    from diffusers.utils import export_to_video
-                    frames = pipe(init_img, decode_chunk_size=2, generator=generator).frames[0]
-                    filename += ".mp4"
-                    export_to_video(frames, os.path.join(OUTPUT_PATH, filename), fps=7)
+                filename = new_output_filename(".mp4")
+                started = time.time()
+                writer = open_video_writer(filename, fallback_video_fps() if pipe is None else 7)
+                try:
+                    if pipe is None:
+                        # Fallback: Generate video by creating multiple frames with img2img
+                        print("Using fallback video generation (img2img frames)...")
+                        generate_fallback_video(init_img, req, generator, writer)
+                    else:
+                        # Use actual SVD; its latents are decoded chunk by chunk into the encoder
+                        with svd_conditioning.bind(pipe, init_img, plan_width, plan_height):
+                            latents = pipe(init_img, width=plan_width, height=plan_height,
+                                           num_frames=video_plan["num_frames"],
+                                           decode_chunk_size=video_plan["decode_chunk_size"],
+                                           generator=generator, output_type="latent",
+                                           **step_progress.pipeline_kwargs(pipe)).frames
+                        stream_video_latents(pipe, latents, video_plan["decode_chunk_size"], writer)
+                except Exception:
+                    writer.abort()
+                    raise
+                generation_seconds = time.time() - started
+                video = writer.close()
+                video["generation_seconds"] = round(generation_seconds, 2)
+                if pipe is not None:
+                    video["plan"] = video_plan
+                print(f"Encoded {video['frames']} frames: {video['encode_seconds']}s encoding alongside "
+                      f"{video['generation_seconds']}s of generation, {video['flush_seconds']}s after it")
+                poster = writer.first_frame
                 
             else: # txt2img
-                result = pipe(
-                    prompt=req.prompt,
-                    negative_prompt=req.negative_prompt,
+                images = pipe(
+                    **get_prompt_kwargs(pipe, req.model_name, [req.prompt], [req.negative_prompt]),
                     num_inference_steps=req.steps,
                     guidance_scale=req.cfg,
                     width=req.width,
                     height=req.height,
-                    generator=generator
-                ).images[0]
-                filename += ".png"
-                result.save(os.path.join(OUTPUT_PATH, filename))
+                    generator=generator,
+                    output_type="latent" if draft else "pil",
+                    **step_progress.pipeline_kwargs(pipe)
+                ).images
+                output_image = draft_images(pipe, images, tiny_vaes, req.width, req.height)[0] if draft else images[0]
+            generation_seconds = time.time() - started
         
         # Fix URL to be relative for frontend
-        return {
+        result = {
             "status": "success", 
             "url": f"outputs/{filename}",
             "type": gen_type,
-            "seed": seed_used
+            "seed": seed_used,
+            "scheduler": scheduler_used,
+            "quality": "draft" if draft else "full",
+            "video": video
         }
+        if output_image is not None:
+            # Encoded outside the pipeline lock so the next job can start denoising
+            result.update(store_output(output_image, req, seed_used, generation_seconds))
+        elif video is not None:
+            index_output(filename, "video", "mp4", seed_used, req, video_timings(video), poster)
+        return result
+
+    except Exception as e:
+        log_generation_error()
+        return {"status": "error", "message": str(e)}
+
+def store_output(image, req: GenerateRequest, seed, generation_seconds):
+    """Queue an output image for encoding and writing; returns its result fields.
+
+    Without `inline` the fields carry the write's Future under "pending",
+    and the job finishes once the file exists. With `inline` the image is
+    encoded here, returned as a data URL, and the file is written behind it.
+    Either way the output is indexed and thumbnailed on the I/O thread right
+    after the write.
+    """
+    fmt = output_writer.resolve(req.output_format)
+    filename = new_output_filename(output_writer.extension(fmt))
+    path = os.path.join(OUTPUT_PATH, filename)
+    fields = {"url": f"outputs/{filename}", "format": fmt,
+              "thumbnail": f"outputs/{output_index.thumbnail_name(filename)}"}
+
+    def on_written(write_seconds):
+        timings = {"generation_seconds": round(generation_seconds, 2), "write_seconds": round(write_seconds, 2)}
+        index_output(filename, "image", fmt, seed, req, timings, image)
+
+    if req.inline:
+        data = output_writer.encode(image, fmt, req.output_quality)
+        output_writer.write(data, path, on_written)
+        fields["data"] = output_writer.data_url(data, fmt)
+    else:
+        fields["pending"] = output_writer.save(image, path, fmt, req.output_quality, on_written)
+    return fields
+
+def new_output_filename(extension):
+    """A fresh output name relative to OUTPUT_PATH, inside its (created) shard directory"""
+    filename = shard_name(f"{uuid.uuid4()}{extension}")
+    os.makedirs(os.path.join(OUTPUT_PATH, os.path.dirname(filename)), exist_ok=True)
+    return filename
+
+# Request fields kept in the output index; the init image itself is not
+INDEXED_PARAMS = ("prompt", "negative_prompt", "model_name", "mode", "steps", "cfg", "width", "height", "strength",
+                  "scheduler", "quality", "output_format", "output_quality")
+
+def index_output(filename, output_type, fmt, seed, req: GenerateRequest, timings, preview):
+    """Record an output in the index; a failure here never fails the generation"""
+    try:
+        params = {name: getattr(req, name, None) for name in INDEXED_PARAMS}
+        params["init_image"] = bool(req.init_image or req._init_image_bytes)
+        output_index.add(filename, output_type, fmt=fmt, seed=seed, params=params, timings=timings,
+                         preview=preview)
+    except Exception as e:
+        print(f"Could not index output {filename}: {e}")
+
+def video_timings(video):
+    return {name: video[name] for name in ("generation_seconds", "encode_seconds", "flush_seconds")}
 
+def request_init_image(req: GenerateRequest, target_size):
+    """The request's init image decoded straight to target_size(source size), or None without one"""
+    if req._init_image_bytes is not None:
+        data = req._init_image_bytes
+    elif req.init_image:
+        data = data_url_bytes(req.init_image)
+    else:
+        return None
+    return load_init_image(data, target_size(image_size(data)))
+
+def log_generation_error():
+    err_msg = traceback.format_exc()
+    # Log to file for agent to read
+    with open("latest_error.txt", "w") as f:
+        f.write(err_msg)
+    print(err_msg)
+
+def use_draft_decoder(pipe, quality):
+    """True when a draft-quality request can be decoded with the tiny VAE"""
+    if quality != "draft":
+        return False
+    try:
+        tiny_vaes.get(encoder_family(pipe))
+        return True
     except Exception as e:
-        import traceback
-        err_msg = traceback.format_exc()
-        # Log to file for agent to read
-        with open("latest_error.txt", "w") as f:
-            f.write(err_msg)
-        print(err_msg)
+        print(f"Tiny VAE unavailable, decoding at full quality: {e}")
+        return False
+
+def validate_request(req: GenerateRequest):
+    """Reject options that would only fail once the job runs"""
+    normalize_scheduler_name(req.scheduler)
+    if req.quality not in (None, "full", "draft"):
+        raise ValueError(f"Unknown quality {req.quality!r}, expected full or draft")
+    normalize_output_format(req.output_format)
+    if req.output_quality is not None and not 1 <= req.output_quality <= 100:
+        raise ValueError("output_quality must be between 1 and 100")
+
+def resolve_seed(seed):
+    import torch
+
+    if seed is not None and seed != -1:
+        return seed
+    return int(torch.randint(0, 2**32 - 1, (1,)).item())
+
+def txt2img_batch_key(req: GenerateRequest):
+    """Requests with the same key can share one batched UNet call"""
+    if get_task(req.mode) != "txt2img":
+        return None
+    return (req.model_name, req.width, req.height, req.steps, req.cfg, normalize_scheduler_name(req.scheduler),
+            req.quality or "full")
+
+def run_generation_batch(reqs):
+    """Run compatible txt2img requests as one batched pipeline call"""
+    import torch
+
+    if len(reqs) == 1:
+        return [run_generation(reqs[0])]
+
+    try:
+        first = reqs[0]
+        pipe = load_model(first.model_name, first.mode)
+        if pipe is None:
+            return [run_generation(req) for req in reqs]
+
+        # One generator per prompt keeps every image reproducible from its own seed
+        seeds = [resolve_seed(req.seed) for req in reqs]
+        generators = [torch.Generator(device="cpu").manual_seed(seed) for seed in seeds]
+        step_progress = StepProgress(current_jobs(), first.steps, previewer=previewer, size=(first.width, first.height))
+        draft = use_draft_decoder(pipe, first.quality)
+
+        print(f"Running batched txt2img: {len(reqs)} prompts on {first.model_name}")
+        with pipe._generation_lock, inference_context(pipe):
+            started = time.time()
+            plan_for_request(pipe, first.width, first.height, len(reqs))
+            scheduler_used = select_scheduler(pipe, first.scheduler)
+            images = pipe(
+                **get_prompt_kwargs(pipe, first.model_name,
+                                    [req.prompt or "" for req in reqs],
+                                    [req.negative_prompt or "" for req in reqs]),
+                num_inference_steps=first.steps,
+                guidance_scale=first.cfg,
+                width=first.width,
+                height=first.height,
+                generator=generators,
+                output_type="latent" if draft else "pil",
+                **step_progress.pipeline_kwargs(pipe)
+            ).images
+            if draft:
+                images = draft_images(pipe, images, tiny_vaes, first.width, first.height)
+            generation_seconds = time.time() - started
+
+        results = []
+        for req, image, seed in zip(reqs, images, seeds):
+            result = {"status": "success", "type": "image", "seed": seed,
+                      "scheduler": scheduler_used, "quality": "draft" if draft else "full"}
+            result.update(store_output(image, req, seed, generation_seconds))
+            results.append(result)
+        return results
+
+    except Exception as e:
+        log_generation_error()
+        return [{"status": "error", "message": str(e)} for _ in reqs]
+
+# Pipelines loaded and warmed up in the background right after startup
+PREWARM_ENABLED = os.environ.get("PREWARM_ENABLED", "true").lower() == "true"
+prewarm_targets = parse_prewarm_targets(os.environ.get("PREWARM_MODELS"), DEFAULT_MODEL)
+model_prewarmer = ModelPrewarmer(
+    load_model,
+    prewarm_targets,
+    parse_resolutions(os.environ.get("PREWARM_RESOLUTIONS", "512x512")),
+    warmup_steps=int(os.environ.get("PREWARM_STEPS", "2")),
+)
+
+# Optional pool of pinned worker processes, each holding its own models; 0 keeps generation in-process
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", "0"))
+worker_pool = None
+if WORKER_PROCESSES > 0:
+    worker_pool = WorkerPool(
+        WORKER_PROCESSES,
+        parse_core_sets(os.environ.get("WORKER_CORES", ""), WORKER_PROCESSES),
+        affinity_slack=int(os.environ.get("WORKER_AFFINITY_SLACK", "1")),
+        prewarm_targets=prewarm_targets if PREWARM_ENABLED else [],
+    )
+
+# Generation jobs run on background worker threads so the event loop stays responsive.
+# Queued txt2img jobs for the same model/size/steps/cfg are coalesced into one call.
+# With a worker pool, each thread hands its job to a worker process and waits for it.
+job_queue = JobQueue(
+    worker_pool.run if worker_pool is not None else run_generation,
+    workers=WORKER_PROCESSES or int(os.environ.get("JOB_WORKERS", "1")),
+    max_queue=int(os.environ.get("JOB_QUEUE_MAX", "16")),
+    history=int(os.environ.get("JOB_HISTORY", "200")),
+    batch_handler=worker_pool.run_batch if worker_pool is not None else run_generation_batch,
+    batch_key=txt2img_batch_key,
+    max_batch_size=int(os.environ.get("MAX_BATCH_SIZE", "1")),
+    batch_window=float(os.environ.get("BATCH_WINDOW_MS", "50")) / 1000,
+)
+
+# How often progress streams check their job for changes
+PROGRESS_POLL_SECONDS = float(os.environ.get("PROGRESS_POLL_SECONDS", "0.25"))
+
+@app.post("/generate")
+async def generate(req: GenerateRequest):
+    # Blocking variant kept for existing clients; it shares the job queue limits
+    try:
+        validate_request(req)
+        job = job_queue.submit(req)
+    except (QueueFullError, ValueError) as e:
         return {"status": "error", "message": str(e)}
+    await run_in_threadpool(job.wait)
+    if job.result is None:
+        return {"status": "error", "message": job.error}
+    return job.result
+
+@app.post("/jobs", status_code=202)
+async def create_job(req: GenerateRequest):
+    try:
+        validate_request(req)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        job = job_queue.submit(req)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"id": job.id, "state": job.state, "position": job_queue.position(job), "status_url": f"/jobs/{job.id}"}
+
+async def read_upload_request(request: Request):
+    """GenerateRequest of an upload: multipart form with a `request` JSON field and an `image` file,
+    or the raw image bytes as the body with the request JSON in the `request` query parameter"""
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        fields, upload = form.get("request") or "{}", form.get("image")
+        data = await upload.read() if upload is not None and hasattr(upload, "read") else None
+    else:
+        fields, data = request.query_params.get("request") or "{}", await request.body()
+    try:
+        req = GenerateRequest(**json.loads(fields))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid request fields: {e}")
+    if not data:
+        raise HTTPException(status_code=400, detail="No image uploaded")
+    try:
+        image_size(data)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Uploaded file is not a readable image")
+    req.init_image, req._init_image_bytes = None, data
+    return req
+
+@app.post("/generate/upload")
+async def generate_upload(request: Request):
+    """/generate with the init image uploaded as bytes instead of a base64 data URL"""
+    return await generate(await read_upload_request(request))
+
+@app.post("/jobs/upload", status_code=202)
+async def create_upload_job(request: Request):
+    """/jobs with the init image uploaded as bytes instead of a base64 data URL"""
+    return await create_job(await read_upload_request(request))
+
+@app.get("/jobs")
+async def list_jobs():
+    return job_queue.stats()
+
+@app.get("/workers")
+async def list_workers():
+    """Per-process utilization, queue depth and loaded models of the worker pool"""
+    if worker_pool is None:
+        return {"mode": "threads", "workers": job_queue.stats()["workers"]}
+    return dict(worker_pool.stats(), mode="processes")
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    info = job.to_dict()
+    info["position"] = job_queue.position(job)
+    return info
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-Sent Events stream of a job's state and per-step progress"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        last_version = -1
+        while True:
+            # Read `done` first so the final state change is always emitted
+            finished = job.done
+            if job.version != last_version:
+                last_version = job.version
+                info = job.to_dict()
+                info["position"] = job_queue.position(job)
+                yield f"data: {json.dumps(info)}\n\n"
+            if finished:
+                break
+            await asyncio.sleep(PROGRESS_POLL_SECONDS)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/outputs")
+async def list_outputs(cursor: Optional[str] = None, limit: int = 50, type: Optional[str] = None):
+    """Indexed outputs, newest first; pass the returned next_cursor to get the following page"""
+    try:
+        return await run_in_threadpool(output_index.page, cursor, max(1, min(limit, 200)), type)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/outputs/stats")
+async def output_stats():
+    """Indexed output usage against the quota, evictions so far and free space on the outputs disk"""
+    return await run_in_threadpool(output_retention.stats)
+
+def check_output_name(filename):
+    # Only "name.ext" or "<shard>/name.ext" inside OUTPUT_PATH
+    if not is_output_name(filename):
+        raise HTTPException(status_code=400, detail="Invalid filename")
+
+@app.post("/outputs/{filename:path}/pin")
+async def pin_output(filename: str):
+    """Keep an output whatever the quota and max age"""
+    check_output_name(filename)
+    if not await run_in_threadpool(output_index.set_pinned, filename, True):
+        raise HTTPException(status_code=404, detail="Output not found")
+    return {"status": "success", "pinned": True}
+
+@app.delete("/outputs/{filename:path}/pin")
+async def unpin_output(filename: str):
+    check_output_name(filename)
+    if not await run_in_threadpool(output_index.set_pinned, filename, False):
+        raise HTTPException(status_code=404, detail="Output not found")
+    return {"status": "success", "pinned": False}
+
+@app.delete("/outputs/{filename:path}")
+async def delete_output(filename: str):
+    """Delete an output file together with its thumbnail and index entry"""
+    check_output_name(filename)
+    if not await run_in_threadpool(output_retention.delete, filename):
+        raise HTTPException(status_code=404, detail="Output not found")
+    return {"status": "success"}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,60 @@
+import gc
+
+try:
+    import psutil
+except ImportError:
+    print("WARNING: psutil not available, memory monitoring disabled")
+    psutil = None
+
+
+def get_memory_usage():
+    """Get current memory usage in MB"""
+    if psutil is None:
+        return 0.0
+    process = psutil.Process()
+    return process.memory_info().rss / (1024 * 1024)
+
+
+def get_available_memory():
+    """Get available system memory in MB (None if psutil is missing)"""
+    if psutil is None:
+        return None
+    return psutil.virtual_memory().available / (1024 * 1024)
+
+
+def check_memory_available(required_mb=1024):
+    """Check if we have enough memory available"""
+    if psutil is None:
+        return True  # Assume OK if psutil not available
+
+    memory = psutil.virtual_memory()
+    available_mb = memory.available / (1024 * 1024)
+    total_mb = memory.total / (1024 * 1024)
+
+    print(f"Memory: {available_mb:.0f}MB available / {total_mb:.0f}MB total")
+    return available_mb > required_mb
+
+
+def release_pipeline(pipe, move_to_cpu=True):
+    """Move a pipeline's modules to CPU (unless told not to) and drop cached allocator memory"""
+    import torch
+
+    if pipe is not None and move_to_cpu:
+        try:
+            # Move to CPU and clear CUDA cache if available
+            pipe.to("cpu")
+            if hasattr(pipe, "vae"):
+                pipe.vae.to("cpu")
+            if hasattr(pipe, "unet"):
+                pipe.unet.to("cpu")
+        except Exception:
+            pass
+
+    # Force garbage collection
+    gc.collect()
+
+    # Clear any cached tensors
+    if hasattr(torch, 'cuda') and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    elif hasattr(torch, 'mps') and torch.backends.mps.is_available():
+        torch.mps.empty_cache()
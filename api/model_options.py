@@ -0,0 +1,27 @@
+def parse_model_options(spec):
+    """Parse per-model options from "model=opt+opt;other=opt+key:value".
+
+    The model name "*" applies to every model; a model's own entry is merged
+    on top. Plain options become True, "key:value" options keep their value.
+    """
+    options = {}
+    for entry in (spec or "").split(";"):
+        entry = entry.strip()
+        if not entry or "=" not in entry:
+            continue
+        model_name, _, flags = entry.partition("=")
+        parsed = {}
+        for flag in flags.split("+"):
+            flag = flag.strip()
+            if not flag:
+                continue
+            key, sep, value = flag.partition(":")
+            parsed[key.strip()] = value.strip() if sep else True
+        options[model_name.strip()] = parsed
+    return options
+
+
+def options_for(options, model_name):
+    merged = dict(options.get("*", {}))
+    merged.update(options.get(model_name, {}))
+    return merged
@@ -0,0 +1,310 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Output files the index picks up from disk, by extension
+OUTPUT_TYPES = {".png": "image", ".webp": "image", ".jpg": "image", ".mp4": "video"}
+
+_COLUMNS = ("id", "filename", "type", "format", "created_at", "bytes", "width", "height", "seed", "model_name",
+            "mode", "prompt", "params", "timings", "thumbnail", "accessed_at", "pinned")
+
+# New outputs go to OUTPUT_PATH/<first SHARD_CHARS of the name>/, 256 directories for UUID names
+SHARD_CHARS = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL UNIQUE,
+    type TEXT NOT NULL,
+    format TEXT,
+    created_at REAL NOT NULL,
+    bytes INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    seed INTEGER,
+    model_name TEXT,
+    mode TEXT,
+    prompt TEXT,
+    params TEXT,
+    timings TEXT,
+    thumbnail TEXT,
+    accessed_at REAL,
+    pinned INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS outputs_newest ON outputs (created_at DESC, id DESC);
+"""
+
+# Columns added after the first release of the index, with their definitions
+_ADDED_COLUMNS = (("accessed_at", "REAL"), ("pinned", "INTEGER NOT NULL DEFAULT 0"))
+
+_EVICTION_INDEX = "CREATE INDEX IF NOT EXISTS outputs_eviction ON outputs (pinned, accessed_at)"
+
+
+def shard_name(filename):
+    """Output name relative to OUTPUT_PATH inside its shard directory ("3f2c...png" -> "3f/3f2c...png").
+
+    Names that don't start with SHARD_CHARS lowercase hex digits have no
+    shard and stay flat, so every path produced here is one `sync()` scans.
+    """
+    prefix = filename[:SHARD_CHARS]
+    return f"{prefix}/{filename}" if is_shard(prefix) else filename
+
+
+def is_shard(name):
+    return len(name) == SHARD_CHARS and all(char in "0123456789abcdef" for char in name)
+
+
+def is_output_name(filename):
+    """True for an output path relative to OUTPUT_PATH: "name.ext" or "<shard>/name.ext" """
+    parts = filename.split("/")
+    if len(parts) > 2 or (len(parts) == 2 and not is_shard(parts[0])):
+        return False
+    name = parts[-1]
+    return ("\\" not in name and not name.startswith(".")
+            and os.path.splitext(name)[1].lower() in OUTPUT_TYPES)
+
+
+def encode_cursor(row):
+    return f"{row['created_at']!r}_{row['id']}"
+
+
+def decode_cursor(cursor):
+    """(created_at, id) of a cursor returned by `page()`; raises ValueError on anything else"""
+    created_at, _, row_id = cursor.rpartition("_")
+    return float(created_at), int(row_id)
+
+
+class OutputIndex:
+    """SQLite index of generated outputs with a WebP thumbnail per file.
+
+    `add()` is called once a file is on disk: it records size, seed, params
+    and timings and writes a thumbnail (the image itself, or a video's first
+    frame as its poster) to `<output_dir>/thumbs/<shard>/<name>.webp`. `page()` lists
+    newest first with a keyset cursor, so a gallery page costs one indexed
+    query however many outputs exist, instead of a directory scan. `sync()`
+    indexes files that appeared without going through `add()` and drops rows
+    whose file is gone.
+
+    Worker processes open the same database; WAL mode lets them write while
+    the API process reads.
+    """
+
+    def __init__(self, db_path, output_dir, thumbnail_size=256, thumbnail_quality=70):
+        self.db_path = db_path
+        self.output_dir = output_dir
+        self.thumbnail_size = thumbnail_size
+        self.thumbnail_quality = thumbnail_quality
+        self._local = threading.local()
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with self._init_lock:
+                if not self._initialized:
+                    connection.executescript(_SCHEMA)
+                    columns = {row["name"] for row in connection.execute("PRAGMA table_info(outputs)")}
+                    for name, definition in _ADDED_COLUMNS:
+                        if name not in columns:
+                            connection.execute(f"ALTER TABLE outputs ADD COLUMN {name} {definition}")
+                    connection.execute("UPDATE outputs SET accessed_at = created_at WHERE accessed_at IS NULL")
+                    connection.execute(_EVICTION_INDEX)
+                    connection.commit()
+                    self._initialized = True
+            self._local.connection = connection
+        return connection
+
+    def thumbnail_name(self, filename):
+        return f"thumbs/{os.path.splitext(filename)[0]}.webp"
+
+    def add(self, filename, output_type, fmt=None, seed=None, params=None, timings=None, preview=None):
+        """Record a written output; `preview` is the PIL image to thumbnail (a video's first frame)"""
+        path = os.path.join(self.output_dir, filename)
+        stat = os.stat(path)
+        width = height = None
+        thumbnail = None
+        if preview is not None:
+            width, height = preview.size
+            thumbnail = self._write_thumbnail(filename, preview)
+        params = params or {}
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO outputs (filename, type, format, created_at, bytes, width, height, seed, "
+                "model_name, mode, prompt, params, timings, thumbnail, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (filename, output_type, fmt, stat.st_mtime, stat.st_size, width, height, seed,
+                 params.get("model_name"), params.get("mode"), params.get("prompt"),
+                 json.dumps(params), json.dumps(timings or {}), thumbnail, max(stat.st_mtime, stat.st_atime)))
+
+    def page(self, cursor=None, limit=50, output_type=None):
+        """Up to `limit` outputs older than `cursor`, newest first, and the cursor of the next page"""
+        where, args = [], []
+        if cursor:
+            created_at, row_id = decode_cursor(cursor)
+            where.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            args += [created_at, created_at, row_id]
+        if output_type:
+            where.append("type = ?")
+            args.append(output_type)
+        query = f"SELECT {', '.join(_COLUMNS)} FROM outputs"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        rows = self._connect().execute(query, args + [limit + 1]).fetchall()
+        items = [self._item(row) for row in rows[:limit]]
+        return {"items": items, "next_cursor": encode_cursor(rows[limit - 1]) if len(rows) > limit else None}
+
+    def get(self, filename):
+        row = self._connect().execute(f"SELECT {', '.join(_COLUMNS)} FROM outputs WHERE filename = ?",
+                                      (filename,)).fetchone()
+        return self._item(row) if row is not None else None
+
+    def remove(self, filename):
+        """Drop an output's row and thumbnail (not the output file itself)"""
+        with self._connect() as connection:
+            row = connection.execute("SELECT thumbnail FROM outputs WHERE filename = ?", (filename,)).fetchone()
+            connection.execute("DELETE FROM outputs WHERE filename = ?", (filename,))
+        if row is not None and row["thumbnail"]:
+            _remove_file(os.path.join(self.output_dir, row["thumbnail"]))
+        return row is not None
+
+    def touch(self, filename, accessed_at=None):
+        """Mark an output as just read, moving it to the back of the eviction order"""
+        with self._connect() as connection:
+            connection.execute("UPDATE outputs SET accessed_at = ? WHERE filename = ?",
+                               (accessed_at or time.time(), filename))
+
+    def set_pinned(self, filename, pinned):
+        """Pin (never evict) or unpin an output; False when it isn't indexed"""
+        with self._connect() as connection:
+            cursor = connection.execute("UPDATE outputs SET pinned = ? WHERE filename = ?", (int(pinned), filename))
+        return cursor.rowcount > 0
+
+    def expired(self, created_before, limit):
+        """Unpinned outputs created before `created_before`, oldest first"""
+        return self._connect().execute(
+            "SELECT filename, bytes, accessed_at FROM outputs WHERE pinned = 0 AND created_at < ? "
+            "ORDER BY created_at LIMIT ?", (created_before, limit)).fetchall()
+
+    def least_recently_accessed(self, created_before, limit):
+        """Unpinned outputs created before `created_before`, least recently accessed first"""
+        return self._connect().execute(
+            "SELECT filename, bytes, accessed_at FROM outputs WHERE pinned = 0 AND created_at < ? "
+            "ORDER BY accessed_at LIMIT ?", (created_before, limit)).fetchall()
+
+    def usage(self):
+        row = self._connect().execute(
+            "SELECT COUNT(*) AS outputs, COALESCE(SUM(bytes), 0) AS bytes, COALESCE(SUM(pinned), 0) AS pinned, "
+            "COALESCE(SUM(CASE WHEN pinned THEN bytes ELSE 0 END), 0) AS pinned_bytes FROM outputs").fetchone()
+        return dict(row)
+
+    def sync(self):
+        """Index output files missing from the index and forget rows whose file was deleted.
+
+        Files still lying flat in the output directory (written before
+        sharding) are moved into their shard directory on the way; names
+        without a shard (not starting with hex digits) are indexed in place.
+        """
+        started = time.time()
+        on_disk = set()
+        moved = 0
+        for entry in os.scandir(self.output_dir):
+            if entry.is_dir() and is_shard(entry.name):
+                on_disk.update(f"{entry.name}/{child.name}" for child in os.scandir(entry.path)
+                               if child.is_file() and is_output_name(child.name))
+            elif entry.is_file() and is_output_name(entry.name) and entry.name != "placeholder.png":
+                if shard_name(entry.name) == entry.name:
+                    on_disk.add(entry.name)
+                else:
+                    on_disk.add(self._move_to_shard(entry.name))
+                    moved += 1
+        indexed = {row["filename"] for row in self._connect().execute("SELECT filename FROM outputs")}
+        for filename in indexed - on_disk:
+            self.remove(filename)
+        added = 0
+        for filename in sorted(on_disk - indexed):
+            extension = os.path.splitext(filename)[1].lower()
+            output_type = OUTPUT_TYPES[extension]
+            try:
+                preview = _read_preview(os.path.join(self.output_dir, filename), output_type)
+                fmt = {".jpg": "jpeg"}.get(extension, extension.lstrip("."))
+                self.add(filename, output_type, fmt=fmt, preview=preview)
+                added += 1
+            except Exception as e:
+                print(f"Could not index {filename}: {e}")
+        print(f"Output index: {added} added, {len(indexed - on_disk)} removed, {moved} moved into shards "
+              f"in {time.time() - started:.1f}s")
+
+    def _move_to_shard(self, filename):
+        """Move a flat output (and its thumbnail and row, if indexed) into its shard directory"""
+        sharded = shard_name(filename)
+        os.makedirs(os.path.join(self.output_dir, os.path.dirname(sharded)), exist_ok=True)
+        os.replace(os.path.join(self.output_dir, filename), os.path.join(self.output_dir, sharded))
+        old_thumbnail = os.path.join(self.output_dir, self.thumbnail_name(filename))
+        thumbnail = None
+        if os.path.exists(old_thumbnail):
+            thumbnail = self.thumbnail_name(sharded)
+            os.makedirs(os.path.dirname(os.path.join(self.output_dir, thumbnail)), exist_ok=True)
+            os.replace(old_thumbnail, os.path.join(self.output_dir, thumbnail))
+        with self._connect() as connection:
+            connection.execute("UPDATE outputs SET filename = ?, thumbnail = ? WHERE filename = ?",
+                               (sharded, thumbnail, filename))
+        return sharded
+
+    def _write_thumbnail(self, filename, image):
+        from PIL import Image
+
+        name = self.thumbnail_name(filename)
+        path = os.path.join(self.output_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        thumbnail = image.convert("RGB")
+        # reducing_gap box-reduces first, so large images stay cheap to thumbnail
+        thumbnail.thumbnail((self.thumbnail_size, self.thumbnail_size), Image.LANCZOS, reducing_gap=2.0)
+        thumbnail.save(path + ".part", format="WEBP", quality=self.thumbnail_quality, method=4)
+        os.replace(path + ".part", path)
+        return name
+
+    def _item(self, row):
+        item = {column: row[column] for column in _COLUMNS}
+        item["url"] = f"outputs/{row['filename']}"
+        item["thumbnail"] = f"outputs/{row['thumbnail']}" if row["thumbnail"] else None
+        item["params"] = json.loads(row["params"] or "{}")
+        item["timings"] = json.loads(row["timings"] or "{}")
+        item["pinned"] = bool(row["pinned"])
+        return item
+
+
+def _read_preview(path, output_type):
+    """The image to thumbnail for a file already on disk: the image, or a video's first frame"""
+    from PIL import Image
+
+    if output_type == "image":
+        with Image.open(path) as image:
+            return image.convert("RGB")
+    try:
+        import cv2
+    except ImportError:
+        return None
+    capture = cv2.VideoCapture(path)
+    try:
+        ok, frame = capture.read()
+    finally:
+        capture.release()
+    return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)) if ok else None
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,148 @@
+import os
+import threading
+from collections import OrderedDict
+
+from memory_utils import get_memory_usage, get_available_memory, release_pipeline
+
+
+class PipelineCache:
+    """LRU cache of loaded pipelines keyed by (checkpoint, task).
+
+    Entries are evicted least-recently-used first whenever loading or keeping
+    a pipeline would push the process RSS over `max_rss_mb`, or leave less
+    than `min_available_mb` of system RAM free.
+    """
+
+    def __init__(self, max_entries=3, max_rss_mb=0, min_available_mb=2048):
+        self.max_entries = max_entries
+        self.max_rss_mb = max_rss_mb
+        self.min_available_mb = min_available_mb
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached pipeline for key (marking it recently used) or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["pipe"]
+
+    def peek(self, key):
+        """Return the cached pipeline without touching LRU order or counters"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry["pipe"] if entry is not None else None
+
+    def put(self, key, pipe, size_mb=0.0):
+        """Insert a freshly loaded pipeline and enforce the limits"""
+        with self._lock:
+            self._entries[key] = {"pipe": pipe, "size_mb": size_mb}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._evict_oldest()
+            # Never evict the entry we just inserted
+            while len(self._entries) > 1 and self._over_budget(0):
+                self._evict_oldest()
+
+    def make_room(self, required_mb):
+        """Evict LRU entries until `required_mb` more can be loaded within budget"""
+        with self._lock:
+            while self._entries and (
+                len(self._entries) >= self.max_entries or self._over_budget(required_mb)
+            ):
+                self._evict_oldest()
+
+    def evict(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._release(key, entry)
+
+    def clear(self):
+        with self._lock:
+            while self._entries:
+                self._evict_oldest()
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries.keys())
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": [
+                    {"model": key[0], "task": key[1], "size_mb": round(entry["size_mb"], 1)}
+                    for key, entry in self._entries.items()
+                ],
+                "max_entries": self.max_entries,
+                "max_rss_mb": self.max_rss_mb,
+                "min_available_mb": self.min_available_mb,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "rss_mb": round(get_memory_usage(), 1),
+            }
+
+    def _over_budget(self, required_mb):
+        if self.max_rss_mb and get_memory_usage() + required_mb > self.max_rss_mb:
+            return True
+        available_mb = get_available_memory()
+        if available_mb is not None and available_mb - required_mb < self.min_available_mb:
+            return True
+        return False
+
+    def _evict_oldest(self):
+        key, entry = self._entries.popitem(last=False)
+        self._release(key, entry)
+
+    def _release(self, key, entry):
+        self.evictions += 1
+        print(f"Evicting cached pipeline {key[0]} ({key[1]}), ~{entry['size_mb']:.0f} MB")
+        pipe = entry.pop("pipe")
+        del entry
+        # Only drop the reference when a cached sibling (a derived task pipeline) shares the modules,
+        # or when another worker thread is generating with it: moving them would pull them out from under it
+        lock = getattr(pipe, "_generation_lock", None)
+        idle = lock is None or lock.acquire(blocking=False)
+        try:
+            move = idle and not self._shares_modules(pipe)
+            if not move:
+                print(f"Modules of {key[0]} ({key[1]}) still in use, leaving them in place")
+            release_pipeline(pipe, move_to_cpu=move)
+        finally:
+            if idle and lock is not None:
+                lock.release()
+        del pipe
+        print(f"Memory after eviction: {get_memory_usage():.1f} MB")
+
+    def _shares_modules(self, pipe):
+        """True when a pipeline still in the cache holds any of pipe's modules"""
+        modules = {id(module) for module in _modules(pipe)}
+        return any(id(module) in modules
+                   for entry in self._entries.values() for module in _modules(entry["pipe"]))
+
+
+def _modules(pipe):
+    components = getattr(pipe, "components", None) or {}
+    return [module for module in components.values() if hasattr(module, "parameters")]
+
+
+def estimate_checkpoint_mb(checkpoint_path):
+    """Rough RAM estimate for a checkpoint loaded as float32.
+
+    Most published checkpoints are stored in fp16, so the in-memory float32
+    copy is about twice the file size.
+    """
+    try:
+        return os.path.getsize(checkpoint_path) / (1024 * 1024) * 2
+    except OSError:
+        return 0.0
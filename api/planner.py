@@ -0,0 +1,205 @@
+import os
+import platform
+
+from memory_utils import psutil, get_available_memory
+
+# Heuristic sizes, see `python benchmark.py planner` for the measurements behind them
+VAE_DECODE_BYTES_PER_PIXEL = 128 * 4 * 3  # ~3 live 128-channel fp32 activations at full resolution
+TILED_VAE_MIN_SIDE = 1536                  # beyond this the untiled decoder rarely fits a 16GB box
+ATTENTION_HEADS = 8
+ATTENTION_CHANNELS = 320
+
+
+def attention_layout(unet_config=None):
+    """(latent downscale, heads, channels) of a UNet's highest-resolution attention block.
+
+    SD 1.x/2.x attend at full latent resolution; SDXL has no attention in
+    its first block, so its largest attention runs at half resolution with
+    more heads. Without a config the SD 1.5 layout is assumed.
+    """
+    if unet_config is None:
+        return 1, ATTENTION_HEADS, ATTENTION_CHANNELS
+    down_blocks = unet_config.get("down_block_types") or ()
+    level = next((index for index, name in enumerate(down_blocks) if "CrossAttn" in name), 0)
+    channels = (unet_config.get("block_out_channels") or (ATTENTION_CHANNELS,))[level]
+    # diffusers stores head counts under attention_head_dim for SD/SDXL checkpoints
+    heads = unet_config.get("num_attention_heads") or unet_config.get("attention_head_dim") or ATTENTION_HEADS
+    if isinstance(heads, (list, tuple)):
+        heads = heads[level]
+    return 2 ** level, heads, channels
+
+
+def detect_hardware():
+    """Cores, RAM, CPU features and accelerators of this machine"""
+    import torch
+
+    logical = os.cpu_count() or 1
+    # Cores this process may run on (a pinned worker process sees only its own set)
+    affinity = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else logical
+    physical = psutil.cpu_count(logical=False) if psutil is not None else None
+    total_mb = psutil.virtual_memory().total / (1024 * 1024) if psutil is not None else None
+
+    cpu_flags = set()
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    cpu_flags = set(line.split(":", 1)[1].split())
+                    break
+    except OSError:
+        pass
+
+    accelerator = None
+    accelerator_memory_mb = None
+    if torch.cuda.is_available():
+        accelerator = "cuda"
+        accelerator_memory_mb = torch.cuda.get_device_properties(0).total_memory / (1024 * 1024)
+    elif hasattr(torch.backends, "mps") and torch.backends.mps.is_available():
+        accelerator = "mps"
+
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "logical_cores": logical,
+        "physical_cores": physical or logical,
+        "affinity_cores": affinity,
+        "total_memory_mb": round(total_mb) if total_mb else None,
+        "available_memory_mb": round(get_available_memory()) if psutil is not None else None,
+        "avx512": "avx512f" in cpu_flags,
+        "avx512_bf16": "avx512_bf16" in cpu_flags,
+        "amx": "amx_bf16" in cpu_flags or "amx_tile" in cpu_flags,
+        "accelerator": accelerator,
+        "accelerator_memory_mb": round(accelerator_memory_mb) if accelerator_memory_mb else None,
+        "sdpa": hasattr(torch.nn.functional, "scaled_dot_product_attention"),
+    }
+
+
+class ExecutionPlanner:
+    """Chooses device, attention, VAE, offload and thread settings per (model, resolution).
+
+    Replaces the old fixed recipe (max attention slicing, VAE slicing and
+    tiling, model CPU offload) that was applied even on CPU-only hosts, where
+    offloading to CPU from CPU only adds hook overhead and max slicing makes
+    small images slower.
+    """
+
+    def __init__(self, workers=1):
+        self.workers = max(1, workers)
+        self._hardware = None
+
+    @property
+    def hardware(self):
+        if self._hardware is None:
+            self._hardware = detect_hardware()
+        return self._hardware
+
+    def plan(self, model_mb, width=512, height=512, batch_size=1, unet_config=None):
+        hw = self.hardware
+        available_mb = get_available_memory() or hw["total_memory_mb"] or 0
+        reasons = []
+
+        # Device: use the accelerator when the weights fit in its memory with headroom
+        device = "cpu"
+        offload = None
+        if hw["accelerator"] == "cuda":
+            device = "cuda"
+            if hw["accelerator_memory_mb"] and model_mb > hw["accelerator_memory_mb"] * 0.8:
+                offload = "model"
+                reasons.append("weights exceed 80% of GPU memory: model CPU offload")
+        elif hw["accelerator"] == "mps":
+            device = "mps"
+        else:
+            reasons.append("no accelerator: run on CPU without offload hooks")
+
+        # Attention at the highest-resolution attention block, with CFG doubling the batch
+        downscale, heads, channels = attention_layout(unet_config)
+        tokens = (width // 8 // downscale) * (height // 8 // downscale)
+        if hw["sdpa"]:
+            # The fused kernel never materializes the tokens x tokens matrix: only q, k, v and the output live
+            attention_mb = tokens * channels * 4 * 2 * batch_size * 4 / (1024 * 1024)
+        else:
+            # The default processor builds the full attention matrix per head
+            attention_mb = tokens * tokens * heads * 2 * batch_size * 4 / (1024 * 1024)
+        if hw["sdpa"]:
+            attention_slicing = None
+            reasons.append("SDPA available: fused attention, no slicing")
+        elif attention_mb < available_mb * 0.5:
+            attention_slicing = "auto"
+            reasons.append("no SDPA: slice attention in halves")
+        else:
+            attention_slicing = "max"
+            reasons.append(f"attention needs ~{attention_mb:.0f}MB: max slicing")
+
+        # VAE: slicing only matters for batches, tiling only for large or memory-tight decodes
+        vae_slicing = batch_size > 1
+        decode_mb = width * height * batch_size * VAE_DECODE_BYTES_PER_PIXEL / (1024 * 1024)
+        vae_tiling = max(width, height) >= TILED_VAE_MIN_SIDE or decode_mb > available_mb * 0.25
+        if vae_tiling:
+            reasons.append(f"VAE decode needs ~{decode_mb:.0f}MB: tiled decode")
+
+        # Threads: split the usable physical cores between concurrent job workers
+        threads = max(1, min(hw["physical_cores"], hw["affinity_cores"]) // self.workers)
+
+        return {
+            "device": device,
+            "offload": offload,
+            "attention_slicing": attention_slicing,
+            "vae_slicing": vae_slicing,
+            "vae_tiling": vae_tiling,
+            "threads": threads,
+            "width": width,
+            "height": height,
+            "batch_size": batch_size,
+            "model_mb": round(model_mb),
+            "estimated_attention_mb": round(attention_mb),
+            "estimated_vae_decode_mb": round(decode_mb),
+            "reasons": reasons,
+        }
+
+
+def apply_load_plan(pipe, plan):
+    """Device placement, offload and threads: decided once when a pipeline is loaded"""
+    import torch
+
+    if torch.get_num_threads() != plan["threads"]:
+        torch.set_num_threads(plan["threads"])
+        print(f"torch threads set to {plan['threads']}")
+
+    if plan["offload"] == "model" and hasattr(pipe, "enable_model_cpu_offload"):
+        try:
+            pipe.enable_model_cpu_offload()
+            print("Enabled model CPU offload")
+        except Exception as e:
+            print(f"CPU offload not available: {e}")
+            pipe.to(plan["device"])
+    else:
+        pipe.to(plan["device"])
+    pipe._load_plan = plan
+
+
+def apply_request_plan(pipe, plan):
+    """Attention and VAE settings: cheap toggles re-applied when the resolution changes"""
+    # txt2img/img2img siblings share modules, so remember the applied settings on the VAE
+    holder = getattr(pipe, "vae", None) or pipe
+    key = (plan["attention_slicing"], plan["vae_slicing"], plan["vae_tiling"])
+    if getattr(holder, "_request_plan_key", None) == key:
+        return
+
+    if plan["attention_slicing"] and hasattr(pipe, "enable_attention_slicing"):
+        pipe.enable_attention_slicing(plan["attention_slicing"])
+    elif hasattr(pipe, "disable_attention_slicing"):
+        pipe.disable_attention_slicing()
+
+    vae = getattr(pipe, "vae", None)
+    if vae is not None and hasattr(vae, "enable_slicing"):
+        if plan["vae_slicing"]:
+            vae.enable_slicing()
+        else:
+            vae.disable_slicing()
+    if vae is not None and hasattr(vae, "enable_tiling"):
+        if plan["vae_tiling"]:
+            vae.enable_tiling()
+        else:
+            vae.disable_tiling()
+
+    holder._request_plan_key = key
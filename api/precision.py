@@ -0,0 +1,75 @@
+import contextlib
+
+# Model options understood here (see MODEL_OPTIONS in .env.example):
+#   bf16           - cast weights to bfloat16 (half the memory traffic)
+#   bf16_autocast  - keep float32 weights, run matmuls/convs in bfloat16
+#   channels_last  - NHWC memory format for UNet and VAE convolutions
+#   compile        - torch.compile the UNet/transformer, one graph per input shape
+PRECISION_OPTIONS = ("bf16", "bf16_autocast", "channels_last", "compile")
+
+
+def denoiser_of(pipe):
+    return getattr(pipe, "unet", None) or getattr(pipe, "transformer", None)
+
+
+def apply_precision(pipe, options, hardware):
+    """Apply the opt-in precision/layout/compile modes to a freshly loaded pipeline"""
+    import torch
+
+    applied = []
+    bf16_native = hardware.get("avx512_bf16") or hardware.get("amx") or hardware.get("accelerator") == "cuda"
+    wants_bf16 = options.get("bf16") or options.get("bf16_autocast")
+    if wants_bf16 and not bf16_native:
+        print("WARNING: bf16 requested but this CPU has no AVX512-BF16/AMX; expect emulation to be slower")
+
+    if options.get("bf16"):
+        pipe.to(dtype=torch.bfloat16)
+        applied.append("bf16")
+    elif options.get("bf16_autocast"):
+        applied.append("bf16_autocast")
+
+    if options.get("channels_last"):
+        for name in ("unet", "vae"):
+            module = getattr(pipe, name, None)
+            if module is not None:
+                module.to(memory_format=torch.channels_last)
+        applied.append("channels_last")
+
+    if options.get("compile"):
+        denoiser = denoiser_of(pipe)
+        if denoiser is not None and hasattr(torch, "compile"):
+            # dynamic=False: each (batch, resolution) compiles once and is reused afterwards
+            compiled = torch.compile(denoiser, dynamic=False)
+            if getattr(pipe, "unet", None) is not None:
+                pipe.unet = compiled
+            else:
+                pipe.transformer = compiled
+            pipe._compiled_shapes = set()
+            applied.append("compile")
+
+    pipe._precision = applied
+    return applied
+
+
+def note_request_shape(pipe, width, height, batch_size=1):
+    """Log when a compiled pipeline sees a new shape (first request pays the compile)"""
+    shapes = getattr(pipe, "_compiled_shapes", None)
+    if shapes is None:
+        return
+    shape = (batch_size, width, height)
+    if shape not in shapes:
+        shapes.add(shape)
+        print(f"torch.compile: new shape {width}x{height} batch {batch_size}, compiling "
+              f"({len(shapes)} compiled shape(s) for this pipeline)")
+
+
+def inference_context(pipe):
+    """no_grad plus bf16 autocast when the pipeline was loaded with bf16_autocast"""
+    import torch
+
+    stack = contextlib.ExitStack()
+    stack.enter_context(torch.no_grad())
+    if "bf16_autocast" in getattr(pipe, "_precision", []):
+        device_type = "cuda" if str(getattr(pipe, "device", "cpu")).startswith("cuda") else "cpu"
+        stack.enter_context(torch.autocast(device_type, dtype=torch.bfloat16))
+    return stack
@@ -0,0 +1,149 @@
+import base64
+import threading
+import time
+from io import BytesIO
+
+from prompt_cache import encoder_family
+
+# Linear latent -> RGB projections per model family (rows: latent channels, columns: R, G, B)
+# plus an RGB bias. Good enough to see composition and colors at latent resolution.
+LATENT_RGB_FACTORS = {
+    "sd": (
+        [[0.3512, 0.2297, 0.3227],
+         [0.3250, 0.4974, 0.2350],
+         [-0.2829, 0.1762, 0.2721],
+         [-0.2120, -0.2616, -0.7177]],
+        [0.0, 0.0, 0.0],
+    ),
+    "sdxl": (
+        [[0.3651, 0.4232, 0.4341],
+         [-0.2533, -0.0042, 0.1068],
+         [0.1076, 0.1111, -0.0362],
+         [-0.3165, -0.2492, -0.2188]],
+        [0.1084, -0.0175, -0.0011],
+    ),
+    "flux": (
+        [[-0.0346, 0.0244, 0.0681],
+         [0.0034, 0.0210, 0.0687],
+         [0.0275, -0.0668, -0.0433],
+         [-0.0174, 0.0160, 0.0617],
+         [0.0859, 0.0721, 0.0329],
+         [0.0004, 0.0383, 0.0115],
+         [0.0405, 0.0861, 0.0915],
+         [-0.0236, -0.0185, -0.0259],
+         [-0.0245, 0.0250, 0.1180],
+         [0.1008, 0.0755, -0.0421],
+         [-0.0515, 0.0201, 0.0011],
+         [0.0428, -0.0012, -0.0036],
+         [0.0817, 0.0765, 0.0749],
+         [-0.1264, -0.0522, -0.1103],
+         [-0.0280, -0.0881, -0.0499],
+         [-0.1262, -0.0982, -0.0778]],
+        [-0.0329, -0.0718, -0.0851],
+    ),
+}
+
+# Tiny autoencoders (TAESD family), overridable with TINY_VAE_SD / TINY_VAE_SDXL / TINY_VAE_FLUX
+TINY_VAE_SOURCES = {"sd": "madebyollin/taesd", "sdxl": "madebyollin/taesdxl", "flux": "madebyollin/taef1"}
+
+
+def spatial_latents(pipe, latents, width, height):
+    """Latents as (batch, channels, h, w): unpacks Flux sequences, takes the first frame of video latents"""
+    if latents.ndim == 3 and hasattr(pipe, "_unpack_latents"):
+        return pipe._unpack_latents(latents, height, width, pipe.vae_scale_factor)
+    if latents.ndim == 5:
+        return latents[:, 0]
+    return latents
+
+
+class TinyVaeCache:
+    """Loads one tiny autoencoder per model family on first use"""
+
+    def __init__(self, sources):
+        self.sources = sources
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def get(self, family):
+        with self._lock:
+            model = self._models.get(family)
+            if model is None:
+                import torch
+                from diffusers import AutoencoderTiny
+
+                started = time.time()
+                model = AutoencoderTiny.from_pretrained(self.sources[family], torch_dtype=torch.float32).eval()
+                self._models[family] = model
+                print(f"Loaded tiny VAE for {family} from {self.sources[family]} in {time.time() - started:.1f}s")
+            return model
+
+    def decode(self, pipe, latents, width, height):
+        """Decode denoising-space latents to images in [-1, 1] with the family's tiny VAE"""
+        import torch
+
+        tiny = self.get(encoder_family(pipe))
+        latents = spatial_latents(pipe, latents, width, height).to("cpu", torch.float32)
+        # Same un-scaling the pipelines apply before their own VAE decode
+        latents = latents / tiny.config.scaling_factor + (getattr(tiny.config, "shift_factor", 0.0) or 0.0)
+        with torch.no_grad():
+            return tiny.decode(latents).sample
+
+
+class LatentPreviewer:
+    """Low-resolution RGB previews of intermediate latents every `every_steps` steps.
+
+    The "linear" decoder projects latent channels to RGB with a fixed
+    per-family matrix (microseconds, latent resolution); "tiny" runs the
+    family's tiny autoencoder (milliseconds, full resolution, closer colors).
+    Previews are JPEG data URLs scaled to at most `max_side` pixels.
+    """
+
+    def __init__(self, every_steps=5, decoder="linear", tiny_vaes=None, max_side=256):
+        self.every_steps = every_steps
+        self.decoder = decoder
+        self.tiny_vaes = tiny_vaes
+        self.max_side = max_side
+
+    def due(self, step, total_steps):
+        if self.every_steps <= 0:
+            return False
+        return step % self.every_steps == 0 or step == total_steps
+
+    def previews(self, pipe, latents, width, height):
+        """One preview data URL per batch item, or None if previews failed"""
+        try:
+            if self.decoder == "tiny" and self.tiny_vaes is not None:
+                images = self.tiny_vaes.decode(pipe, latents, width, height)
+            else:
+                images = self._linear(pipe, latents, width, height)
+            return [self._encode(image) for image in images]
+        except Exception as e:
+            # Never fail a generation over a preview
+            print(f"Disabling previews for this call: {e}")
+            return None
+
+    def _linear(self, pipe, latents, width, height):
+        import torch
+
+        factors, bias = LATENT_RGB_FACTORS[encoder_family(pipe)]
+        latents = spatial_latents(pipe, latents, width, height).detach().to("cpu", torch.float32)
+        factors = torch.tensor(factors)[:latents.shape[1]]
+        rgb = torch.einsum("bchw,cr->brhw", latents, factors) + torch.tensor(bias).view(1, 3, 1, 1)
+        return rgb
+
+    def _encode(self, image):
+        import numpy as np
+        from PIL import Image
+
+        array = ((image.float().clamp(-1, 1) + 1) * 127.5).permute(1, 2, 0).byte().cpu().numpy()
+        preview = Image.fromarray(np.ascontiguousarray(array))
+        preview.thumbnail((self.max_side, self.max_side))
+        buffer = BytesIO()
+        preview.save(buffer, format="JPEG", quality=70)
+        return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def draft_images(pipe, latents, tiny_vaes, width, height):
+    """Final images decoded with the tiny VAE instead of the full one ("draft" quality)"""
+    images = tiny_vaes.decode(pipe, latents, width, height)
+    return pipe.image_processor.postprocess(images, output_type="pil")
@@ -0,0 +1,109 @@
+import threading
+import time
+
+
+def parse_prewarm_targets(spec, default_model):
+    """Parse "model[:task],model[:task]" into (model, task) pairs"""
+    if spec is None:
+        spec = f"{default_model}:txt2img" if default_model else ""
+    targets = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        model_name, _, task = item.partition(":")
+        targets.append((model_name.strip(), task.strip() or "txt2img"))
+    return targets
+
+
+def parse_resolutions(spec):
+    """Parse "512x512,768x768" into (width, height) pairs"""
+    resolutions = []
+    for item in spec.split(","):
+        item = item.strip().lower()
+        if "x" in item:
+            width, height = item.split("x", 1)
+            resolutions.append((int(width), int(height)))
+    return resolutions
+
+
+class ModelPrewarmer:
+    """Loads configured (model, task) pairs in the background after startup.
+
+    Each pipeline runs a tiny generation per resolution so allocator growth
+    and oneDNN kernel selection happen before the first user request.
+    `readiness()` reports the state of every target.
+    """
+
+    def __init__(self, load_fn, targets, resolutions, warmup_steps=2):
+        self.load_fn = load_fn
+        self.targets = targets
+        self.resolutions = resolutions
+        self.warmup_steps = warmup_steps
+        self._states = {self._key(model, task): {"state": "pending"} for model, task in targets}
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None or not self.targets:
+            return
+        self._thread = threading.Thread(target=self._run, name="model-prewarm", daemon=True)
+        self._thread.start()
+
+    def readiness(self):
+        return {key: dict(state) for key, state in self._states.items()}
+
+    def target_state(self, model_name, task="txt2img"):
+        """State of one target (pending, loading, warming, ready, unavailable or failed), None if not a target"""
+        state = self._states.get(self._key(model_name, task))
+        return dict(state) if state is not None else None
+
+    def _key(self, model_name, task):
+        return f"{model_name}:{task}"
+
+    def _run(self):
+        for model_name, task in self.targets:
+            state = self._states[self._key(model_name, task)]
+            started = time.time()
+            try:
+                state["state"] = "loading"
+                pipe = self.load_fn(model_name, task)
+                if pipe is None:
+                    state.update(state="unavailable", load_seconds=round(time.time() - started, 2))
+                    continue
+                state["load_seconds"] = round(time.time() - started, 2)
+
+                state["state"] = "warming"
+                warm_started = time.time()
+                for width, height in self.resolutions:
+                    self._warmup(pipe, task, width, height)
+                state["warmup_seconds"] = round(time.time() - warm_started, 2)
+                state["state"] = "ready"
+                print(f"Prewarmed {model_name} ({task}) in {time.time() - started:.1f}s")
+            except Exception as e:
+                state.update(state="failed", error=str(e))
+                print(f"Prewarm of {model_name} ({task}) failed: {e}")
+
+    def _warmup(self, pipe, task, width, height):
+        import torch
+        from PIL import Image
+
+        kwargs = {
+            "prompt": "warmup",
+            "num_inference_steps": self.warmup_steps,
+            "generator": torch.Generator(device="cpu").manual_seed(0),
+        }
+        if task == "img2img":
+            kwargs["image"] = Image.new("RGB", (width, height), (127, 127, 127))
+            kwargs["strength"] = 1.0
+        elif task == "txt2img":
+            kwargs["width"] = width
+            kwargs["height"] = height
+        else:
+            # Video pipelines are too slow to warm up usefully; loading is enough
+            return
+
+        from precision import inference_context
+
+        lock = getattr(pipe, "_generation_lock", None) or threading.Lock()
+        with lock, inference_context(pipe):
+            pipe(**kwargs)
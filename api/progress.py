@@ -0,0 +1,85 @@
+import inspect
+import time
+
+from memory_utils import get_memory_usage
+
+
+class StepProgress:
+    """Publishes per-step denoising progress of one pipeline call on its jobs.
+
+    `pipeline_kwargs(pipe)` returns the callback arguments the pipeline
+    understands: `callback_on_step_end` on current diffusers, the legacy
+    `callback`/`callback_steps` pair on older releases.
+
+    With a `previewer`, every few steps the current latents are turned into a
+    preview image; job i of a batched call gets the preview of batch item i.
+    `size` is the output (width, height), needed to unpack Flux latents.
+    """
+
+    def __init__(self, jobs, total_steps, stage="denoise", previewer=None, size=None):
+        # A batched call reports the same progress on every job in the batch
+        self.jobs = list(jobs)
+        self.total_steps = max(1, int(total_steps))
+        self.stage = stage
+        self.previewer = previewer
+        self.size = size or (512, 512)
+        self.started_at = time.time()
+        self._pipe = None
+        self._previews = None
+        self._preview_step = None
+        self._preview_ms = None
+
+    def pipeline_kwargs(self, pipe):
+        if not self.jobs:
+            return {}
+        self._pipe = pipe
+        params = inspect.signature(pipe.__call__).parameters
+        if "callback_on_step_end" in params:
+            return {"callback_on_step_end": self.on_step_end}
+        if "callback" in params:
+            return {"callback": self.on_legacy_step, "callback_steps": 1}
+        return {}
+
+    def on_step_end(self, pipe, step, timestep, callback_kwargs):
+        # The pipeline knows the real step count (img2img skips steps by strength)
+        total_steps = getattr(pipe, "_num_timesteps", None)
+        if total_steps:
+            self.total_steps = total_steps
+        self._update_previews(step + 1, callback_kwargs.get("latents"))
+        self.report(step + 1)
+        return callback_kwargs
+
+    def on_legacy_step(self, step, timestep, latents):
+        self._update_previews(step + 1, latents)
+        self.report(step + 1)
+
+    def _update_previews(self, step, latents):
+        if self.previewer is None or latents is None or not self.previewer.due(step, self.total_steps):
+            return
+        started = time.time()
+        previews = self.previewer.previews(self._pipe, latents, *self.size)
+        if previews is None:
+            self.previewer = None
+        elif previews:
+            self._previews = previews
+            self._preview_step = step
+            self._preview_ms = round((time.time() - started) * 1000, 1)
+
+    def report(self, step):
+        elapsed = time.time() - self.started_at
+        remaining = max(self.total_steps - step, 0)
+        progress = {
+            "stage": self.stage,
+            "step": step,
+            "total_steps": self.total_steps,
+            "elapsed_seconds": round(elapsed, 2),
+            "eta_seconds": round(elapsed / step * remaining, 2) if step else None,
+            "seconds_per_step": round(elapsed / step, 3) if step else None,
+            "rss_mb": round(get_memory_usage(), 1),
+        }
+        for index, job in enumerate(self.jobs):
+            if self._previews:
+                # The latest preview stays on every update so late subscribers see it too
+                progress = dict(progress, preview=self._previews[min(index, len(self._previews) - 1)],
+                                preview_step=self._preview_step, preview_ms=self._preview_ms)
+            job.update_progress(progress)
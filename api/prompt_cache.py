@@ -0,0 +1,185 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+def encoder_family(pipe):
+    """Which text-encoder stack a pipeline uses: "flux", "sdxl" or "sd" """
+    name = pipe.__class__.__name__
+    if "Flux" in name:
+        return "flux"
+    if "XL" in name:
+        return "sdxl"
+    return "sd"
+
+
+def _tensor_bytes(tensors):
+    return sum(t.numel() * t.element_size() for t in tensors.values())
+
+
+class PromptEmbeddingCache:
+    """LRU cache of text-encoder outputs keyed by (checkpoint, encoder, prompt).
+
+    Each prompt is encoded on its own (no classifier-free guidance pairing),
+    which gives the same tensors the pipelines compute for the positive and
+    the negative branch. The memory tier is bounded by `max_bytes`; with
+    `disk_dir` set, entries are also written as safetensors files that
+    survive restarts, bounded by `disk_max_bytes` (oldest files go first).
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, disk_dir=None, disk_max_bytes=1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def pipeline_kwargs(self, pipe, model_key, prompts, negative_prompts):
+        """Embedding kwargs replacing prompt/negative_prompt for one pipeline call"""
+        import torch
+
+        family = encoder_family(pipe)
+        positives = [self.get_embeddings(pipe, model_key, family, text or "") for text in prompts]
+        kwargs = {
+            "prompt_embeds": torch.cat([e["prompt_embeds"] for e in positives]),
+        }
+        if family in ("sdxl", "flux"):
+            kwargs["pooled_prompt_embeds"] = torch.cat([e["pooled_prompt_embeds"] for e in positives])
+        if family == "flux":
+            # Flux is guidance-distilled and has no negative branch
+            return kwargs
+
+        negatives = [self.get_embeddings(pipe, model_key, family, text or "") for text in negative_prompts]
+        kwargs["negative_prompt_embeds"] = torch.cat([e["prompt_embeds"] for e in negatives])
+        if family == "sdxl":
+            kwargs["negative_pooled_prompt_embeds"] = torch.cat([e["pooled_prompt_embeds"] for e in negatives])
+        return kwargs
+
+    def get_embeddings(self, pipe, model_key, family, text):
+        key = (model_key, family, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = self._load_from_disk(key)
+        if entry is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            entry = self._encode(pipe, family, text)
+            self._save_to_disk(key, entry)
+        self._insert(key, entry)
+        return entry
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+                "disk_dir": self.disk_dir,
+                "disk_bytes": self._disk_usage()[0] if self.disk_dir and os.path.isdir(self.disk_dir) else 0,
+            }
+
+    def _encode(self, pipe, family, text):
+        import torch
+
+        device = getattr(pipe, "_execution_device", "cpu")
+        with torch.no_grad():
+            if family == "flux":
+                prompt_embeds, pooled_prompt_embeds, _ = pipe.encode_prompt(
+                    prompt=text, prompt_2=None, device=device, num_images_per_prompt=1
+                )
+                entry = {"prompt_embeds": prompt_embeds, "pooled_prompt_embeds": pooled_prompt_embeds}
+            elif family == "sdxl":
+                prompt_embeds, _, pooled_prompt_embeds, _ = pipe.encode_prompt(
+                    prompt=text, device=device, num_images_per_prompt=1, do_classifier_free_guidance=False
+                )
+                entry = {"prompt_embeds": prompt_embeds, "pooled_prompt_embeds": pooled_prompt_embeds}
+            else:
+                prompt_embeds, _ = pipe.encode_prompt(text, device, 1, False)
+                entry = {"prompt_embeds": prompt_embeds}
+        return {name: t.detach().to("cpu").contiguous() for name, t in entry.items()}
+
+    def _insert(self, key, entry):
+        size = _tensor_bytes(entry)
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= _tensor_bytes(old)
+                self.evictions += 1
+
+    def _disk_path(self, key):
+        digest = hashlib.sha256("\0".join(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.safetensors")
+
+    def _load_from_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            from safetensors.torch import load_file
+            entry = load_file(path)
+            os.utime(path)  # Keep recently used files away from disk eviction
+            return entry
+        except Exception as e:
+            print(f"Prompt cache: ignoring unreadable {path}: {e}")
+            return None
+
+    def _save_to_disk(self, key, entry):
+        if not self.disk_dir:
+            return
+        try:
+            from safetensors.torch import save_file
+            os.makedirs(self.disk_dir, exist_ok=True)
+            path = self._disk_path(key)
+            tmp_path = path + ".tmp"
+            save_file(entry, tmp_path)
+            os.replace(tmp_path, path)
+            self._trim_disk()
+        except Exception as e:
+            print(f"Prompt cache: could not write disk entry: {e}")
+
+    def _disk_usage(self):
+        files = []
+        total = 0
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".safetensors"):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            stat = os.stat(path)
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        return total, files
+
+    def _trim_disk(self):
+        total, files = self._disk_usage()
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
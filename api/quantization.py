@@ -0,0 +1,116 @@
+import os
+import time
+
+from checkpoint_cache import checkpoint_fingerprint
+
+# Components whose nn.Linear layers get dynamic int8 weights
+QUANTIZED_COMPONENTS = ("unet", "transformer", "text_encoder", "text_encoder_2")
+
+
+def _linear_weight_bytes(module):
+    """Bytes held by Linear weights, float or packed int8"""
+    import torch
+    import torch.ao.nn.quantized.dynamic as nnqd
+
+    total = 0
+    for child in module.modules():
+        if isinstance(child, nnqd.Linear):
+            weight = child.weight()
+            total += weight.numel() * weight.element_size()
+        elif isinstance(child, torch.nn.Linear):
+            total += child.weight.numel() * child.weight.element_size()
+    return total
+
+
+def _swap_linear_shells(module, swapped=None):
+    """Replace every nn.Linear with an empty dynamic int8 Linear ready for load_state_dict.
+
+    Returns the (parent, name, original Linear) swaps so `_restore_linears` can undo them.
+    """
+    import torch
+    import torch.ao.nn.quantized.dynamic as nnqd
+
+    swapped = [] if swapped is None else swapped
+    for name, child in module.named_children():
+        if isinstance(child, torch.nn.Linear):
+            setattr(module, name, nnqd.Linear(child.in_features, child.out_features,
+                                              bias_=child.bias is not None, dtype=torch.qint8))
+            swapped.append((module, name, child))
+        else:
+            _swap_linear_shells(child, swapped)
+    return swapped
+
+
+def _restore_linears(swapped):
+    for parent, name, child in swapped:
+        setattr(parent, name, child)
+
+
+def _load_cached(module, path):
+    """Load a cached int8 state dict into int8 shells; False (module untouched) when it doesn't match.
+
+    The load is strict: a missing or unexpected key (a changed module layout,
+    a truncated file) would otherwise leave zero-weight shells behind and
+    produce garbage images without any error.
+    """
+    import torch
+
+    swapped = _swap_linear_shells(module)
+    try:
+        module.load_state_dict(torch.load(path, map_location="cpu"), strict=True)
+        return True
+    except Exception as e:
+        _restore_linears(swapped)
+        print(f"Quantized cache {path} doesn't match the model, re-quantizing: {e}")
+        return False
+
+
+def quantized_cache_key(checkpoint_path):
+    """Cache file prefix: checkpoint fingerprint plus torch version (packed int8 layout is torch-specific)"""
+    import torch
+
+    stem = os.path.splitext(os.path.basename(checkpoint_path))[0]
+    return f"{stem}-{checkpoint_fingerprint(checkpoint_path)}-torch{torch.__version__.split('+')[0]}"
+
+
+def quantize_pipeline(pipe, cache_dir, cache_key):
+    """Dynamic int8 quantization of UNet/transformer and text-encoder Linear layers.
+
+    The quantized state dicts are cached under `cache_dir` as
+    `<cache_key>-<component>.pt`; later loads swap in empty int8 layers and
+    load those files instead of re-running the quantization pass. Returns a
+    per-component report of memory before/after and time spent.
+    """
+    import torch
+
+    report = {}
+    for name in QUANTIZED_COMPONENTS:
+        module = getattr(pipe, name, None)
+        if module is None or not isinstance(module, torch.nn.Module):
+            continue
+
+        started = time.time()
+        before = _linear_weight_bytes(module)
+        path = os.path.join(cache_dir, f"{cache_key}-{name}.pt")
+        source = "quantized"
+        if os.path.exists(path) and _load_cached(module, path):
+            source = "cache"
+        else:
+            if os.path.exists(path):
+                os.remove(path)
+            torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = path + ".tmp"
+            torch.save(module.state_dict(), tmp_path)
+            os.replace(tmp_path, path)
+
+        after = _linear_weight_bytes(module)
+        report[name] = {
+            "source": source,
+            "linear_mb_before": round(before / (1024 * 1024), 1),
+            "linear_mb_after": round(after / (1024 * 1024), 1),
+            "saved_mb": round((before - after) / (1024 * 1024), 1),
+            "seconds": round(time.time() - started, 2),
+        }
+    pipe._quantization = report
+    return report
@@ -0,0 +1,128 @@
+import os
+import shutil
+import threading
+import time
+
+
+class RetentionManager:
+    """Keeps OUTPUT_PATH within a byte quota and a maximum age, deleting a batch at a time.
+
+    A background thread first syncs the output index, then every
+    `interval` seconds deletes unpinned outputs older than `max_age_seconds`
+    and, while the indexed bytes exceed `quota_bytes`, the least recently
+    accessed ones. Each pass deletes at most `batch` files; when more are
+    due, the next pass follows after a short pause instead of a full
+    interval, so catching up on a large backlog never holds the disk (or the
+    index) for long. Outputs younger than `grace_seconds` are left alone so
+    a client can still fetch what it was just sent.
+
+    Access times come from the index, refreshed from the filesystem's atime
+    before a file is evicted: one read since it was last looked at saves it
+    for another round. With noatime mounts the order degrades to oldest
+    first.
+    """
+
+    def __init__(self, index, output_dir, quota_bytes=0, max_age_seconds=0, interval=60.0, batch=200,
+                 grace_seconds=300):
+        self.index = index
+        self.output_dir = output_dir
+        self.quota_bytes = quota_bytes
+        self.max_age_seconds = max_age_seconds
+        self.interval = interval
+        self.batch = batch
+        self.grace_seconds = grace_seconds
+        self.evicted = 0
+        self.evicted_bytes = 0
+        self.last_pass = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="output-retention", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            self.index.sync()
+        except Exception as e:
+            print(f"Output index sync failed: {e}")
+        while True:
+            try:
+                more = self.run_once()
+            except Exception as e:
+                print(f"Output retention pass failed: {e}")
+                more = False
+            time.sleep(1.0 if more else self.interval)
+
+    def run_once(self, now=None):
+        """One eviction pass; True when more outputs are due than one batch could delete"""
+        if not self.quota_bytes and not self.max_age_seconds:
+            return False
+        now = now or time.time()
+        budget = self.batch
+        with self._lock:
+            if self.max_age_seconds:
+                rows = self.index.expired(now - self.max_age_seconds, budget)
+                for row in rows:
+                    self._evict(row)
+                budget -= len(rows)
+
+            if self.quota_bytes and budget > 0:
+                excess = self.index.usage()["bytes"] - self.quota_bytes
+                while excess > 0 and budget > 0:
+                    rows = self.index.least_recently_accessed(now - self.grace_seconds, min(budget, 50))
+                    if not rows:
+                        break
+                    for row in rows:
+                        budget -= 1
+                        accessed_at = self._accessed_at(row["filename"])
+                        if accessed_at is not None and accessed_at > (row["accessed_at"] or 0) + 1:
+                            # Read since we last looked: give it another round
+                            self.index.touch(row["filename"], accessed_at)
+                            continue
+                        self._evict(row)
+                        excess -= row["bytes"]
+                        if excess <= 0 or budget <= 0:
+                            break
+            self.last_pass = now
+        return budget <= 0
+
+    def delete(self, filename):
+        """Delete an output file with its thumbnail and index entry; False when there was neither"""
+        existed = self._remove(filename)
+        return self.index.remove(filename) or existed
+
+    def _evict(self, row):
+        self.delete(row["filename"])
+        self.evicted += 1
+        self.evicted_bytes += row["bytes"]
+
+    def _accessed_at(self, filename):
+        try:
+            return os.stat(os.path.join(self.output_dir, filename)).st_atime
+        except FileNotFoundError:
+            return None
+
+    def _remove(self, filename):
+        try:
+            os.remove(os.path.join(self.output_dir, filename))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def stats(self):
+        usage = self.index.usage()
+        disk = shutil.disk_usage(self.output_dir)
+        return {
+            "outputs": usage["outputs"],
+            "bytes": usage["bytes"],
+            "pinned": usage["pinned"],
+            "pinned_bytes": usage["pinned_bytes"],
+            "quota_bytes": self.quota_bytes or None,
+            "max_age_seconds": self.max_age_seconds or None,
+            "evicted": self.evicted,
+            "evicted_bytes": self.evicted_bytes,
+            "last_pass": self.last_pass,
+            "disk": {"total": disk.total, "used": disk.used, "free": disk.free},
+        }
@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+pytest.importorskip("PIL")
+
+from PIL import Image
+
+from output_index import OutputIndex, shard_name
+
+
+def test_sync_keeps_unshardable_names_indexed(tmp_path):
+    output_dir = tmp_path / "outputs"
+    output_dir.mkdir()
+    Image.new("RGB", (32, 32), "red").save(output_dir / "my image.png")
+    Image.new("RGB", (32, 32), "blue").save(output_dir / "3f2c0000.png")
+    index = OutputIndex(str(tmp_path / "index.sqlite3"), str(output_dir))
+
+    for _ in range(2):
+        index.sync()
+        names = sorted(item["filename"] for item in index.page(limit=10)["items"])
+        assert names == ["3f/3f2c0000.png", "my image.png"]
+
+    # Names without a hex prefix are indexed where they are, hex ones are moved into their shard
+    assert os.path.exists(output_dir / "my image.png")
+    assert os.path.exists(output_dir / "3f" / "3f2c0000.png")
+    assert index.get("my image.png")["thumbnail"] == "outputs/thumbs/my image.webp"
+    assert shard_name("my image.png") == "my image.png"
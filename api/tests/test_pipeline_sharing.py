@@ -0,0 +1,51 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+diffusers = pytest.importorskip("diffusers")
+transformers = pytest.importorskip("transformers")
+
+
+def tiny_pipeline():
+    """Randomly initialised, few-KB Stable Diffusion txt2img pipeline"""
+    from diffusers import AutoencoderKL, DDIMScheduler, StableDiffusionPipeline, UNet2DConditionModel
+    from transformers import CLIPTextConfig, CLIPTextModel
+
+    torch.manual_seed(0)
+    unet = UNet2DConditionModel(
+        sample_size=8, in_channels=4, out_channels=4, layers_per_block=1, block_out_channels=(32, 64),
+        down_block_types=("CrossAttnDownBlock2D", "DownBlock2D"),
+        up_block_types=("UpBlock2D", "CrossAttnUpBlock2D"),
+        cross_attention_dim=32, attention_head_dim=4, norm_num_groups=8,
+    )
+    vae = AutoencoderKL(
+        in_channels=3, out_channels=3, latent_channels=4, block_out_channels=(8, 16), layers_per_block=1,
+        down_block_types=("DownEncoderBlock2D", "DownEncoderBlock2D"),
+        up_block_types=("UpDecoderBlock2D", "UpDecoderBlock2D"), norm_num_groups=8,
+    )
+    text_encoder = CLIPTextModel(CLIPTextConfig(
+        vocab_size=100, hidden_size=32, intermediate_size=64, num_hidden_layers=1, num_attention_heads=2,
+        max_position_embeddings=16,
+    ))
+    return StableDiffusionPipeline(
+        vae=vae, text_encoder=text_encoder, tokenizer=None, unet=unet, scheduler=DDIMScheduler(clip_sample=False),
+        safety_checker=None, feature_extractor=None, requires_safety_checker=False,
+    )
+
+
+def test_derived_img2img_pipeline_shares_weights():
+    from diffusers import StableDiffusionImg2ImgPipeline
+    from main import derive_task_pipeline
+
+    txt2img = tiny_pipeline()
+    img2img = derive_task_pipeline(txt2img, StableDiffusionImg2ImgPipeline)
+
+    assert isinstance(img2img, StableDiffusionImg2ImgPipeline)
+    for name in ("unet", "vae", "text_encoder"):
+        source = list(getattr(txt2img, name).parameters())
+        derived = list(getattr(img2img, name).parameters())
+        assert len(source) == len(derived)
+        assert all(a.data_ptr() == b.data_ptr() for a, b in zip(source, derived)), name
+
+    # Schedulers keep per-call timestep state, so each task needs its own
+    assert img2img.scheduler is not txt2img.scheduler
+    assert type(img2img.scheduler) is type(txt2img.scheduler)
@@ -0,0 +1,89 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+torch = pytest.importorskip("torch")
+psutil = pytest.importorskip("psutil")
+
+if not sys.platform.startswith("linux"):
+    pytest.skip("PSS is read from /proc/<pid>/smaps", allow_module_level=True)
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAYERS, WIDTH = 4, 2048  # 64 MB of float32 weights
+WEIGHT_MB = LAYERS * WIDTH * (WIDTH + 1) * 4 / (1024 * 1024)
+
+# A worker: report ready after the imports, then build the "model" (privately initialised weights),
+# optionally point it at the mapped file through SharedWeightStore, touch every weight, report loaded
+WORKER = f"""
+import gc, sys, torch
+sys.path.insert(0, {API_DIR!r})
+from weight_store import SharedWeightStore
+
+class Pipe:
+    pass
+
+print("ready", flush=True)
+sys.stdin.readline()
+pipe = Pipe()
+pipe.components = {{"unet": torch.nn.Sequential(*[torch.nn.Linear({WIDTH}, {WIDTH}) for _ in range({LAYERS})])}}
+if sys.argv[2] == "true":
+    SharedWeightStore().attach(pipe, sys.argv[1])
+gc.collect()
+with torch.no_grad():
+    pipe.components["unet"](torch.ones(1, {WIDTH}))
+print("loaded", flush=True)
+sys.stdin.readline()
+"""
+
+
+@pytest.fixture(scope="module")
+def converted_dir(tmp_path_factory):
+    from safetensors.torch import save_file
+
+    directory = tmp_path_factory.mktemp("converted")
+    os.makedirs(directory / "unet")
+    model = torch.nn.Sequential(*[torch.nn.Linear(WIDTH, WIDTH) for _ in range(LAYERS)])
+    save_file(model.state_dict(), str(directory / "unet" / "diffusion_pytorch_model.safetensors"))
+    return str(directory)
+
+
+def weights_pss_mb(workers, converted_dir, shared):
+    """Total PSS the loaded weights add across `workers` processes that all hold them at once"""
+    procs = [subprocess.Popen([sys.executable, "-c", WORKER, converted_dir, shared], text=True,
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+             for _ in range(workers)]
+    try:
+        for proc in procs:
+            assert proc.stdout.readline().strip() == "ready"
+        # Every process has imported torch, so shared library pages are already split between them
+        before = sum(psutil.Process(proc.pid).memory_full_info().pss for proc in procs)
+        for proc in procs:
+            proc.stdin.write("\n")
+            proc.stdin.flush()
+        for proc in procs:
+            assert proc.stdout.readline().strip() == "loaded"
+        after = sum(psutil.Process(proc.pid).memory_full_info().pss for proc in procs)
+    finally:
+        for proc in procs:
+            proc.stdin.close()
+            proc.wait()
+    return (after - before) / (1024 * 1024)
+
+
+def test_shared_weights_are_not_duplicated_per_worker(converted_dir):
+    one = weights_pss_mb(1, converted_dir, "true")
+    two = weights_pss_mb(2, converted_dir, "true")
+    print(json.dumps({"weight_mb": WEIGHT_MB, "one_worker_mb": round(one), "two_workers_mb": round(two)}))
+    assert one > WEIGHT_MB * 0.8
+    # A second worker mapping the same file adds (close to) nothing
+    assert two < one + WEIGHT_MB * 0.5
+
+
+def test_private_weights_grow_per_worker(converted_dir):
+    # Control: the measurement does see a duplicated copy when the store is off
+    one = weights_pss_mb(1, converted_dir, "false")
+    two = weights_pss_mb(2, converted_dir, "false")
+    assert two > one + WEIGHT_MB * 0.8
@@ -0,0 +1,140 @@
+import contextlib
+import hashlib
+import threading
+from collections import OrderedDict
+
+from memory_utils import get_available_memory
+
+# (minimum available MB, width, height, frames, decode chunk size), largest first.
+# Sides are multiples of 64 so the SVD UNet's downsampling stays aligned.
+SVD_MEMORY_TIERS = (
+    (12000, 1024, 576, 25, 4),
+    (8000, 1024, 576, 14, 2),
+    (6000, 768, 448, 14, 2),
+    (4000, 640, 384, 10, 1),
+    (0, 448, 256, 8, 1),
+)
+
+
+def plan_svd(init_size, model_frames, available_mb=None):
+    """Resolution, frame count and decode chunk size for an SVD call from live available memory.
+
+    The largest tier whose memory floor is met wins; frames never exceed
+    what the checkpoint was trained for, and portrait init images get the
+    tier's resolution turned sideways.
+    """
+    if available_mb is None:
+        available_mb = get_available_memory()
+    if available_mb is None:
+        # No psutil: the old fixed settings
+        tier = SVD_MEMORY_TIERS[1]
+    else:
+        tier = next(tier for tier in SVD_MEMORY_TIERS if available_mb >= tier[0])
+    _, width, height, frames, decode_chunk_size = tier
+    if init_size[1] > init_size[0]:
+        width, height = height, width
+    return {
+        "width": width,
+        "height": height,
+        "num_frames": min(frames, model_frames or frames),
+        "decode_chunk_size": decode_chunk_size,
+        "available_mb": round(available_mb) if available_mb is not None else None,
+    }
+
+
+def image_digest(image):
+    """Content hash of a PIL image (pixels and size, not the encoded file)"""
+    digest = hashlib.sha1(f"{image.mode}:{image.size}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class ConditioningCache:
+    """Image-encoder embeddings and VAE conditioning latents of SVD init images.
+
+    `bind(pipe, image, ...)` wraps one pipeline call: the pipeline's
+    `_encode_image` and `_encode_vae_image` are answered from entries keyed by
+    the init image's pixel hash, so re-rolling seed or motion on the same
+    picture skips the CLIP vision encoder and the VAE encoder. Entries live
+    on the pipeline (they die with it) in an LRU of `max_entries` images.
+
+    SVD conditions on the VAE encoding of the init image plus
+    `noise_aug_strength` noise. Upstream draws that noise from the request
+    generator; here it is seeded from the image hash so the latents are the
+    same for every seed and can be reused. The generator still advances by
+    the same amount, so each seed's initial latents are unchanged.
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def bind(self, pipe, image, width, height, noise_aug_strength=0.02):
+        digest = image_digest(image)
+        original_encode_image = pipe._encode_image
+        original_encode_vae_image = pipe._encode_vae_image
+
+        def encode_image(image_input, device, num_videos_per_prompt, do_classifier_free_guidance):
+            embeddings = self._cached(pipe, ("image_embeds", digest),
+                                      lambda: original_encode_image(image_input, device, 1, False))
+            return _expand(embeddings, num_videos_per_prompt, do_classifier_free_guidance)
+
+        def encode_vae_image(image_input, device, num_videos_per_prompt, do_classifier_free_guidance):
+            def encode():
+                import torch
+
+                pixels = pipe.video_processor.preprocess(image, height=height, width=width).to(device)
+                noise_generator = torch.Generator(device="cpu").manual_seed(int(digest[:8], 16))
+                noise = torch.randn(pixels.shape, generator=noise_generator, dtype=pixels.dtype).to(device)
+                return original_encode_vae_image(pixels + noise_aug_strength * noise, device, 1, False)
+
+            latents = self._cached(pipe, ("image_latents", digest, width, height, noise_aug_strength), encode)
+            return _expand(latents, num_videos_per_prompt, do_classifier_free_guidance)
+
+        previous = {name: pipe.__dict__.get(name) for name in ("_encode_image", "_encode_vae_image")}
+        pipe._encode_image = encode_image
+        pipe._encode_vae_image = encode_vae_image
+        try:
+            yield digest
+        finally:
+            for name, value in previous.items():
+                if value is None:
+                    # Let the class method show through again
+                    del pipe.__dict__[name]
+                else:
+                    setattr(pipe, name, value)
+
+    def _cached(self, pipe, key, compute):
+        with self._lock:
+            entries = pipe.__dict__.setdefault("_conditioning_cache", OrderedDict())
+            value = entries.get(key)
+            if value is not None:
+                entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = compute()
+        with self._lock:
+            entries[key] = value
+            # Two entries (embedding and latents) per image
+            while len(entries) > self.max_entries * 2:
+                entries.popitem(last=False)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {"max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+def _expand(tensor, num_videos_per_prompt, do_classifier_free_guidance):
+    """Repeat per video and prepend the zero unconditional half, as the pipeline's encoders do"""
+    import torch
+
+    tensor = tensor.repeat_interleave(num_videos_per_prompt, dim=0)
+    if do_classifier_free_guidance:
+        tensor = torch.cat([torch.zeros_like(tensor), tensor])
+    return tensor
@@ -0,0 +1,143 @@
+import os
+import queue
+import threading
+import time
+
+# Encoders that understand -crf / -preset
+CRF_CODECS = ("libx264", "libx265", "libvpx-vp9", "libaom-av1")
+
+
+class VideoStreamWriter:
+    """Encodes video frames on a background thread as they are produced.
+
+    `add(frame)` queues a PIL image (blocking only when `max_pending`
+    frames are already waiting, so a slow encoder caps memory instead of
+    growing it); the encoder thread resizes it to `size` if given and feeds
+    it to ffmpeg through imageio-ffmpeg with the configured codec and CRF,
+    or to OpenCV's mp4v writer when imageio-ffmpeg is missing. `close()`
+    flushes the queue and returns frame count and timings; `encode_seconds`
+    is the encoder thread's busy time and `flush_seconds` how long closing
+    waited for it, i.e. the encode latency left after generation.
+    """
+
+    def __init__(self, path, fps, codec="libx264", crf=23, preset="veryfast", size=None, max_pending=8):
+        self.path = path
+        self.fps = fps
+        self.codec = codec
+        self.crf = crf
+        self.preset = preset
+        self.size = size
+        self.frames = 0
+        self.encode_seconds = 0.0
+        self.backend = None
+        # First encoded frame, kept as the video's poster
+        self.first_frame = None
+        self._queue = queue.Queue(maxsize=max(1, max_pending))
+        self._error = None
+        self._output = None
+        self._thread = threading.Thread(target=self._run, name="video-writer", daemon=True)
+        self._thread.start()
+
+    def add(self, frame):
+        if self._error is not None:
+            raise RuntimeError(f"Video encoding failed: {self._error}")
+        self._queue.put(frame)
+
+    def close(self):
+        """Finish the file; returns its stats, or raises if encoding failed"""
+        started = time.time()
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            self._remove()
+            raise RuntimeError(f"Video encoding failed: {self._error}")
+        return {
+            "frames": self.frames,
+            "fps": self.fps,
+            "codec": self.codec if self.backend == "ffmpeg" else "mp4v",
+            "crf": self.crf if self.backend == "ffmpeg" and self.codec in CRF_CODECS else None,
+            "backend": self.backend,
+            "encode_seconds": round(self.encode_seconds, 2),
+            "flush_seconds": round(time.time() - started, 2),
+        }
+
+    def abort(self):
+        """Stop encoding and delete the partial file"""
+        self._queue.put(None)
+        self._thread.join()
+        self._remove()
+
+    def _remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _run(self):
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                break
+            if self._error is not None:
+                continue  # Drain so producers never block on a dead encoder
+            started = time.time()
+            try:
+                self._write(frame)
+                self.frames += 1
+            except Exception as e:
+                print(f"Video encoder error: {e}")
+                self._error = e
+            self.encode_seconds += time.time() - started
+        started = time.time()
+        try:
+            self._finish()
+        except Exception as e:
+            self._error = self._error or e
+        self.encode_seconds += time.time() - started
+
+    def _write(self, frame):
+        import numpy as np
+
+        frame = frame.convert("RGB")
+        if self.size is not None and frame.size != tuple(self.size):
+            from PIL import Image
+            frame = frame.resize(tuple(self.size), Image.LANCZOS)
+        array = np.ascontiguousarray(np.asarray(frame))
+        if self.first_frame is None:
+            self.first_frame = frame
+        if self._output is None:
+            self._open(frame.size)
+        if self.backend == "ffmpeg":
+            self._output.send(array)
+        else:
+            import cv2
+            self._output.write(cv2.cvtColor(array, cv2.COLOR_RGB2BGR))
+
+    def _open(self, size):
+        try:
+            import imageio_ffmpeg
+        except ImportError:
+            imageio_ffmpeg = None
+
+        if imageio_ffmpeg is not None:
+            output_params = []
+            if self.codec in CRF_CODECS:
+                output_params += ["-crf", str(self.crf)]
+                if self.preset and self.codec in ("libx264", "libx265"):
+                    output_params += ["-preset", self.preset]
+            # quality=None leaves rate control to the CRF flags above
+            self._output = imageio_ffmpeg.write_frames(self.path, size, fps=self.fps, codec=self.codec,
+                                                       quality=None, output_params=output_params)
+            self._output.send(None)
+            self.backend = "ffmpeg"
+        else:
+            import cv2
+            print("imageio-ffmpeg not installed: encoding mp4v with OpenCV (codec/CRF settings ignored)")
+            self._output = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*"mp4v"), self.fps, size)
+            self.backend = "opencv"
+
+    def _finish(self):
+        if self._output is None:
+            return
+        if self.backend == "ffmpeg":
+            self._output.close()
+        else:
+            self._output.release()
@@ -0,0 +1,103 @@
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+
+# safetensors dtype names -> torch dtype attribute names
+SAFETENSORS_DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+
+
+def map_safetensors(path):
+    """Tensors of a safetensors file backed by a copy-on-write mapping of the file.
+
+    Nothing is read up front: pages come from the OS page cache on first
+    touch, and every process mapping the same file shares those pages. A
+    write to a tensor (an in-place op on a weight) copies just that page
+    into the writing process instead of corrupting the file or the others.
+    """
+    import torch
+
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    data_start = 8 + header_size
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = getattr(torch, SAFETENSORS_DTYPES[info["dtype"]])
+        start, end = info["data_offsets"]
+        count = (end - start) // torch.tensor([], dtype=dtype).element_size()
+        if count == 0:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        tensors[name] = torch.frombuffer(mapped, dtype=dtype, count=count,
+                                         offset=data_start + start).view(info["shape"])
+    # The tensors keep the mapping alive; it is unmapped when the last one is freed
+    return tensors
+
+
+class SharedWeightStore:
+    """Points pipeline weights at memory-mapped copies of the converted checkpoint.
+
+    `attach(pipe, converted_dir)` maps every component's safetensors files
+    from the converted-checkpoint cache and swaps them into the modules with
+    `load_state_dict(assign=True)`, releasing the privately loaded copies.
+    Worker processes (or separate API processes) that load the same
+    checkpoint then share one page-cache copy of the weights, and the kernel
+    can drop clean weight pages under memory pressure instead of swapping.
+    Anything that rewrites weights afterwards (bf16, int8, a GPU move) gives
+    that process its own copy again.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.reports = {}
+        self._lock = threading.Lock()
+
+    def attach(self, pipe, converted_dir):
+        import torch
+
+        report = {"shared_mb": 0.0, "private_mb": 0.0, "components": []}
+        for name, module in pipe.components.items():
+            if not isinstance(module, torch.nn.Module):
+                continue
+            files = sorted(glob.glob(os.path.join(converted_dir, name, "*.safetensors")))
+            if not files:
+                continue
+
+            mapped_state = {}
+            for path in files:
+                mapped_state.update(map_safetensors(path))
+
+            # Only swap tensors that match exactly; anything else stays as loaded
+            current = module.state_dict()
+            usable = {key: tensor for key, tensor in mapped_state.items()
+                      if key in current and current[key].shape == tensor.shape
+                      and current[key].dtype == tensor.dtype and current[key].device.type == "cpu"}
+            if not usable:
+                continue
+            module.load_state_dict(usable, strict=False, assign=True)
+
+            shared = sum(tensor.numel() * tensor.element_size() for tensor in usable.values())
+            total = sum(tensor.numel() * tensor.element_size() for tensor in current.values())
+            report["shared_mb"] += shared / (1024 * 1024)
+            report["private_mb"] += max(total - shared, 0) / (1024 * 1024)
+            report["components"].append(name)
+
+        report["shared_mb"] = round(report["shared_mb"], 1)
+        report["private_mb"] = round(report["private_mb"], 1)
+        with self._lock:
+            self.reports[os.path.basename(converted_dir)] = report
+        return report
+
+    def stats(self):
+        with self._lock:
+            return {"enabled": self.enabled, "checkpoints": dict(self.reports)}
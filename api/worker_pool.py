@@ -0,0 +1,315 @@
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+
+def parse_core_sets(spec, workers):
+    """Parse "0-3;4-7" into one core list per worker.
+
+    Without a spec the cores this process may run on are split into
+    `workers` contiguous, equally sized sets.
+    """
+    if spec and spec.strip():
+        core_sets = []
+        for item in spec.split(";"):
+            cores = []
+            for part in item.split(","):
+                part = part.strip()
+                if "-" in part:
+                    first, last = part.split("-", 1)
+                    cores.extend(range(int(first), int(last) + 1))
+                elif part:
+                    cores.append(int(part))
+            if cores:
+                core_sets.append(cores)
+        return [core_sets[i % len(core_sets)] for i in range(workers)]
+
+    if hasattr(os, "sched_getaffinity"):
+        available = sorted(os.sched_getaffinity(0))
+    else:
+        available = list(range(os.cpu_count() or 1))
+    per_worker = max(1, len(available) // max(1, workers))
+    return [available[i * per_worker:(i + 1) * per_worker] or available for i in range(workers)]
+
+
+def _request_dict(request):
+    data = request.model_dump() if hasattr(request, "model_dump") else request.dict()
+    # Uploaded init image bytes are a private attribute the dump leaves out
+    if getattr(request, "_init_image_bytes", None) is not None:
+        data["_init_image_bytes"] = request._init_image_bytes
+    return data
+
+
+def _request(api, data):
+    data = dict(data)
+    init_image_bytes = data.pop("_init_image_bytes", None)
+    request = api.GenerateRequest(**data)
+    if init_image_bytes is not None:
+        request._init_image_bytes = init_image_bytes
+    return request
+
+
+class _RemoteJob:
+    """Stands in for a Job inside a worker process; progress goes back to the parent"""
+
+    def __init__(self, events, index, task_id):
+        self.events = events
+        self.index = index
+        self.task_id = task_id
+
+    def update_progress(self, progress):
+        self.events.put(("progress", self.index, self.task_id, progress))
+
+
+def _loaded_models(api):
+    return sorted({model_name for model_name, _ in api.pipeline_cache.keys()})
+
+
+def _worker_main(index, cores, tasks, events, env):
+    """Entry point of a worker process: pin, size the thread pool, then serve tasks"""
+    os.environ.update(env)
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    os.environ["OMP_NUM_THREADS"] = str(len(cores) or 1)
+
+    import torch
+    torch.set_num_threads(len(cores) or 1)
+
+    import main as api
+    from jobs import bound_jobs
+
+    events.put(("ready", index, None, os.getpid()))
+    if api.PREWARM_ENABLED:
+        api.model_prewarmer.start()
+
+    models = []
+    prewarm = None
+    while True:
+        # Report this worker's own prewarm progress, so readiness means warmed up, not just assigned
+        if api.model_prewarmer.readiness() != prewarm:
+            prewarm = api.model_prewarmer.readiness()
+            events.put(("prewarm", index, None, prewarm))
+        try:
+            task = tasks.get(timeout=1.0)
+        except queue.Empty:
+            # Let the router see models loaded by prewarming
+            if _loaded_models(api) != models:
+                models = _loaded_models(api)
+                events.put(("models", index, None, models))
+            continue
+        if task is None:
+            break
+
+        task_id, kind, payload = task
+        results, error = None, None
+        try:
+            with bound_jobs([_RemoteJob(events, index, task_id)]):
+                if kind == "batch":
+                    results = api.run_generation_batch([_request(api, item) for item in payload])
+                else:
+                    results = [api.run_generation(_request(api, payload))]
+            # Futures don't cross processes: wait for pending output writes here
+            for result in results:
+                pending = result.pop("pending", None) if isinstance(result, dict) else None
+                if pending is not None:
+                    pending.result()
+        except Exception as e:
+            error = str(e)
+        models = _loaded_models(api)
+        events.put(("done", index, task_id, (results, error, models)))
+
+
+class WorkerPool:
+    """Generation worker processes, each pinned to its own cores with its own models.
+
+    Every worker process imports the API module, pins itself to a core set
+    and sizes torch's thread pool to it, so concurrent requests stop
+    competing for the same cores and the GIL. `run(request)` and
+    `run_batch(requests)` block the calling job-queue thread until the chosen
+    worker answers; per-step progress is forwarded to the jobs bound on that
+    thread. Requests go to the least-busy worker that already holds the
+    checkpoint unless it has more than `affinity_slack` tasks queued beyond
+    the least-busy worker overall.
+    """
+
+    def __init__(self, workers, core_sets, affinity_slack=1, prewarm_targets=()):
+        self.workers = workers
+        self.core_sets = core_sets
+        self.affinity_slack = affinity_slack
+        self.prewarm_targets = list(prewarm_targets)
+        self._context = multiprocessing.get_context("spawn")
+        self._events = self._context.Queue()
+        self._states = []
+        self._tasks = {}
+        self._task_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._listener = None
+        self.started_at = None
+
+    def start(self):
+        with self._lock:
+            if self._listener is not None:
+                return
+            self.started_at = time.time()
+            for index in range(self.workers):
+                self._states.append(self._spawn(index))
+            self._listener = threading.Thread(target=self._listen, name="worker-pool-events", daemon=True)
+            self._listener.start()
+        print(f"Started {self.workers} worker process(es) on cores "
+              f"{'; '.join(','.join(map(str, cores)) for cores in self.core_sets)}")
+
+    def run(self, request):
+        return self._dispatch("single", _request_dict(request), request.model_name)[0]
+
+    def run_batch(self, requests):
+        return self._dispatch("batch", [_request_dict(request) for request in requests], requests[0].model_name)
+
+    def loaded_models(self):
+        with self._lock:
+            return {f"worker-{state['index']}": list(state["models"]) for state in self._states}
+
+    def target_state(self, model_name, task="txt2img"):
+        """Prewarm state of a target as reported by the worker it is assigned to, None if not a target"""
+        key = f"{model_name}:{task}"
+        with self._lock:
+            states = [state["prewarm"].get(key, {"state": "pending"}) for state in self._states
+                      if (model_name, task) in self.prewarm_targets[state["index"]::self.workers]]
+        if not states:
+            return None
+        ready = [state for state in states if state["state"] == "ready"]
+        return dict((ready or states)[0])
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            workers = []
+            for state in self._states:
+                busy = state["busy_seconds"]
+                if state["busy_since"] is not None:
+                    busy += now - state["busy_since"]
+                uptime = max(now - state["started_at"], 1e-6)
+                workers.append({
+                    "index": state["index"],
+                    "pid": state["pid"],
+                    "alive": state["process"].is_alive(),
+                    "cores": state["cores"],
+                    "queue_depth": state["in_flight"],
+                    "utilization": round(min(busy / uptime, 1.0), 3),
+                    "busy_seconds": round(busy, 1),
+                    "completed": state["completed"],
+                    "failed": state["failed"],
+                    "restarts": state["restarts"],
+                    "models": list(state["models"]),
+                })
+            return {"workers": workers, "affinity_slack": self.affinity_slack,
+                    "affinity_hits": sum(s["affinity_hits"] for s in self._states)}
+
+    def _spawn(self, index, restarts=0):
+        targets = self.prewarm_targets[index::self.workers]
+        env = {
+            # Each worker is a single-threaded executor of its own
+            "JOB_WORKERS": "1",
+            "WORKER_PROCESSES": "0",
+            "PREWARM_MODELS": ",".join(f"{model}:{task}" for model, task in targets),
+        }
+        tasks = self._context.Queue()
+        cores = self.core_sets[index]
+        process = self._context.Process(target=_worker_main, args=(index, cores, tasks, self._events, env),
+                                        name=f"generation-worker-{index}", daemon=True)
+        process.start()
+        return {
+            "index": index, "process": process, "pid": process.pid, "tasks": tasks, "cores": cores,
+            "in_flight": 0, "busy_since": None, "busy_seconds": 0.0, "started_at": time.time(),
+            "completed": 0, "failed": 0, "restarts": restarts, "affinity_hits": 0, "models": [],
+            "prewarm": {},
+        }
+
+    def _pick(self, model_name):
+        """Least-busy worker holding the model, unless it is too far behind the least-busy one"""
+        alive = [state for state in self._states if state["process"].is_alive()] or self._states
+        least_busy = min(alive, key=lambda state: state["in_flight"])
+        holders = [state for state in alive if model_name in state["models"]]
+        if holders:
+            holder = min(holders, key=lambda state: state["in_flight"])
+            if holder["in_flight"] <= least_busy["in_flight"] + self.affinity_slack:
+                holder["affinity_hits"] += 1
+                return holder
+        return least_busy
+
+    def _dispatch(self, kind, payload, model_name):
+        from jobs import current_jobs
+
+        self.start()
+        done = threading.Event()
+        task = {"jobs": current_jobs(), "done": done, "result": None}
+        with self._lock:
+            task_id = next(self._task_ids)
+            state = self._pick(model_name)
+            task["worker"] = state["index"]
+            self._tasks[task_id] = task
+            state["in_flight"] += 1
+            if state["busy_since"] is None:
+                state["busy_since"] = time.time()
+            # Assume the model will be there so the next request for it follows this one
+            if model_name not in state["models"]:
+                state["models"] = state["models"] + [model_name]
+            state["tasks"].put((task_id, kind, payload))
+
+        while not done.wait(1.0):
+            if not state["process"].is_alive():
+                self._worker_died(state)
+                break
+
+        results, error, _ = task["result"] or (None, "Worker process exited during generation", None)
+        if error is not None:
+            raise RuntimeError(error)
+        return results
+
+    def _worker_died(self, state):
+        with self._lock:
+            if self._states[state["index"]] is not state:
+                return
+            print(f"Worker process {state['index']} (pid {state['pid']}) exited, restarting it")
+            for task in self._tasks.values():
+                if task["worker"] == state["index"]:
+                    task["done"].set()
+            self._tasks = {task_id: task for task_id, task in self._tasks.items() if not task["done"].is_set()}
+            replacement = self._spawn(state["index"], state["restarts"] + 1)
+            replacement.update(completed=state["completed"], failed=state["failed"] + state["in_flight"])
+            self._states[state["index"]] = replacement
+
+    def _listen(self):
+        while True:
+            kind, index, task_id, payload = self._events.get()
+            with self._lock:
+                state = self._states[index]
+                if kind == "ready":
+                    state["pid"] = payload
+                elif kind == "models":
+                    state["models"] = payload
+                elif kind == "prewarm":
+                    state["prewarm"] = payload
+                elif kind == "progress":
+                    task = self._tasks.get(task_id)
+                    jobs = task["jobs"] if task else []
+                elif kind == "done":
+                    task = self._tasks.pop(task_id, None)
+                    results, error, models = payload
+                    state["models"] = models
+                    state["in_flight"] = max(state["in_flight"] - 1, 0)
+                    if error is None:
+                        state["completed"] += 1
+                    else:
+                        state["failed"] += 1
+                    if state["in_flight"] == 0 and state["busy_since"] is not None:
+                        state["busy_seconds"] += time.time() - state["busy_since"]
+                        state["busy_since"] = None
+            if kind == "progress":
+                for job in jobs:
+                    job.update_progress(payload)
+            elif kind == "done" and task is not None:
+                task["result"] = payload
+                task["done"].set()
@@ -17,16 +17,45 @@ final class GeneratorController extends AbstractController
     ) {}
 
     #[Route('/api/gallery', name: 'api_gallery', methods: ['GET'])]
-    public function gallery(): JsonResponse
+    public function gallery(Request $request): JsonResponse
     {
+        // The backend keeps an index of outputs with thumbnails; the directory scan is only a fallback
+        try {
+            $response = $this->httpClient->request('GET', 'http://127.0.0.1:8000/outputs', [
+                'timeout' => 5,
+                'query' => [
+                    'limit' => (int)$request->query->get('limit', 100),
+                    'cursor' => $request->query->get('cursor'),
+                ],
+            ]);
+            $page = $response->toArray();
+
+            $images = array_map(fn($item) => [
+                'filename' => $item['filename'],
+                'url' => $item['url'],
+                'thumbnail' => $item['thumbnail'],
+                'time' => (int)$item['created_at'],
+                'type' => $item['type'],
+            ], $page['items']);
+
+            return new JsonResponse($images, 200, ['X-Next-Cursor' => $page['next_cursor'] ?? '']);
+        } catch (\Exception $e) {
+            // Backend offline: scan the directory
+        }
+
         $outputsDir = $this->params->get('kernel.project_dir') . '/public/outputs';
-        $files = glob($outputsDir . '/*.{png,mp4}', GLOB_BRACE);
+        // Outputs are sharded into two-character subdirectories; older ones may still lie flat
+        $files = array_merge(
+            glob($outputsDir . '/*.{png,webp,jpg,mp4}', GLOB_BRACE),
+            glob($outputsDir . '/[0-9a-f][0-9a-f]/*.{png,webp,jpg,mp4}', GLOB_BRACE)
+        );
         
         $images = [];
         foreach ($files as $file) {
+            $filename = substr($file, strlen($outputsDir) + 1);
             $images[] = [
-                'filename' => basename($file),
-                'url' => 'outputs/' . basename($file),
+                'filename' => $filename,
+                'url' => 'outputs/' . $filename,
                 'time' => filemtime($file),
                 'type' => str_ends_with($file, '.mp4') ? 'video' : 'image'
             ];
@@ -49,12 +78,23 @@ final class GeneratorController extends AbstractController
             return new JsonResponse(['status' => 'error', 'message' => 'Filename required'], 400);
         }
 
-        // Basic sanity check to prevent directory traversal
-        if (str_contains($filename, '/') || str_contains($filename, '\\')) {
+        // Basic sanity check to prevent directory traversal: "name.ext" or "<shard>/name.ext"
+        if (!preg_match('#^([0-9a-f]{2}/)?[A-Za-z0-9_-][A-Za-z0-9._-]*$#', $filename)) {
             return new JsonResponse(['status' => 'error', 'message' => 'Invalid filename'], 400);
         }
 
-        $filePath = $this->params->get('kernel.project_dir') . '/public/outputs/' . basename($filename);
+        // Let the backend drop the file together with its thumbnail and index entry
+        try {
+            $path = implode('/', array_map('rawurlencode', explode('/', $filename)));
+            $response = $this->httpClient->request('DELETE', 'http://127.0.0.1:8000/outputs/' . $path, ['timeout' => 5]);
+            if ($response->getStatusCode() === 200) {
+                return new JsonResponse(['status' => 'success']);
+            }
+        } catch (\Exception $e) {
+            // Backend offline: delete the file directly
+        }
+
+        $filePath = $this->params->get('kernel.project_dir') . '/public/outputs/' . $filename;
         
         if (file_exists($filePath)) {
             unlink($filePath);
@@ -142,6 +182,8 @@ final class GeneratorController extends AbstractController
                     'strength' => (float)($data['strength'] ?? 0.75),
                     'init_image' => $data['init_image'] ?? null,
                     'seed' => (int)($data['seed'] ?? -1),
+                    'output_format' => $data['output_format'] ?? null,
+                    'inline' => (bool)($data['inline'] ?? false),
                 ]
             ]);
 